@@ -1,7 +1,19 @@
+import contextvars
+import logging
 import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
 from dotenv import load_dotenv
 
+from app.metrics import DB_CHECKOUT, DB_CONNECT, DB_QUERIES_PER_REQUEST
+
 # load from .env
 load_dotenv()
 
@@ -12,6 +24,546 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+
+# query tracing settings
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+DB_EXPLAIN_SAMPLE_RATE = float(os.getenv("DB_EXPLAIN_SAMPLE_RATE", "0"))
+DB_SERVER_TIMING = os.getenv("DB_SERVER_TIMING", "1") == "1"
+
+slow_query_logger = logging.getLogger("app.db.slow")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class QueryTrace:
+    """Number of statements and time spent in them during one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, elapsed: float):
+        # Sync handlers run in the threadpool, async ones on the loop.
+        with self._lock:
+            self.count += 1
+            self.duration += elapsed
+
+    def server_timing(self) -> str:
+        return 'db;dur=%.1f;desc="%d queries"' % (self.duration * 1000, self.count)
+
+    def finish(self):
+        DB_QUERIES_PER_REQUEST.observe(self.count)
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("query_trace", default=None)
+
+
+def begin_trace() -> tuple[QueryTrace, contextvars.Token]:
+    trace = QueryTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+
+def observe_query(elapsed: float) -> bool:
+    """Count a statement in the current request; True when it was slow."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(elapsed)
+    return elapsed * 1000 >= DB_SLOW_QUERY_MS
+
+
+def wants_explain(query) -> bool:
+    if DB_EXPLAIN_SAMPLE_RATE <= 0 or random.random() >= DB_EXPLAIN_SAMPLE_RATE:
+        return False
+    head = _statement_text(query).lstrip().split(None, 1)
+    return bool(head) and head[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def _statement_text(query) -> str:
+    if isinstance(query, bytes):
+        # Already bound by psycopg2 (execute_values): drop the inlined values.
+        query = query.decode("utf-8", "replace")
+        cut = query.upper().find(" VALUES ")
+        if cut != -1:
+            query = query[:cut] + " VALUES <redacted>"
+    # One line per statement; drop -- comments so they don't swallow the rest.
+    return " ".join(re.sub(r"--[^\n]*", "", str(query)).split())
+
+
+def redact_params(params) -> str:
+    """Parameter types (and sizes) only, never values."""
+    if params is None:
+        return "none"
+
+    def describe(value) -> str:
+        if isinstance(value, (str, bytes, list, tuple, dict)):
+            return "%s(%d)" % (type(value).__name__, len(value))
+        return type(value).__name__
+
+    if isinstance(params, dict):
+        return "{%s}" % ", ".join("%s: %s" % (k, describe(v)) for k, v in params.items())
+    return "[%s]" % ", ".join(describe(v) for v in params)
+
+
+def redact_plan(lines) -> str:
+    """EXPLAIN output without the conditions and filters, which hold values."""
+    return "\n".join(re.sub(r"((?:Cond|Filter): ).*", r"\1<redacted>", line) for line in lines)
+
+
+def log_slow_query(query, params, elapsed: float, plan: str | None = None):
+    slow_query_logger.warning(
+        "slow query %.1f ms: %s params=%s%s",
+        elapsed * 1000,
+        _statement_text(query),
+        redact_params(params),
+        "\n" + plan if plan else "",
+    )
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor used by pooled connections: every statement is counted in the
+    request trace, and slow ones are logged (optionally with their plan).
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        super().execute(query, vars)
+        self._traced(query, vars, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        super().executemany(query, vars_list)
+        # No single set of parameters to EXPLAIN with.
+        self._traced(query, None, started, explain=False)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        super().copy_expert(sql, file, size)
+        self._traced(sql, None, started, explain=False)
+
+    def _traced(self, query, vars, started: float, explain: bool = True):
+        # Failed statements are not counted: the request fails anyway.
+        elapsed = time.perf_counter() - started
+        if observe_query(elapsed):
+            plan = self._explain(query, vars) if explain and wants_explain(query) else None
+            log_slow_query(query, vars, elapsed, plan)
+
+    def _explain(self, query, vars) -> str:
+        # Plain EXPLAIN only plans the statement, it doesn't run it again.
+        # Inside a transaction it runs in a savepoint, so a failing EXPLAIN
+        # doesn't abort the caller's transaction.
+        if isinstance(query, bytes):
+            query = query.decode("utf-8")
+        savepoint = self.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        with psycopg2.extensions.cursor(self.connection) as cur:
+            if savepoint:
+                cur.execute("SAVEPOINT explain_plan")
+            try:
+                cur.execute("EXPLAIN " + query, vars)
+                plan = redact_plan(line for (line,) in cur.fetchall())
+            except psycopg2.Error as e:
+                plan = "EXPLAIN failed: %s" % e
+                if savepoint:
+                    cur.execute("ROLLBACK TO SAVEPOINT explain_plan")
+            if savepoint:
+                cur.execute("RELEASE SAVEPOINT explain_plan")
+            return plan
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections idle longer than `check_after` seconds are pinged with
+    SELECT 1 on checkout; connections idle longer than `max_idle` are closed
+    (down to `min_size`). Checkout waits up to `timeout` seconds for a free
+    slot when `max_size` connections are already out.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        max_idle: float = 300.0,
+        check_after: float = 30.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (min_size, max_size))
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (conn, released_at), most recently used on the right
+        self._size = 0  # idle + checked out + being opened
+        self._closed = False
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "idle_evictions": 0,
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = psycopg2.connect(self.dsn, cursor_factory=TracingCursor)
+        DB_CONNECT.labels("psycopg2").observe(time.perf_counter() - started)
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats["connections_closed"] += 1
+            self._lock.notify()
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict_idle(self, now: float) -> list:
+        # Caller holds the lock. Oldest connections sit on the left.
+        evicted = []
+        while (
+            self._idle
+            and self._size > self.min_size
+            and now - self._idle[0][1] > self.max_idle
+        ):
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["idle_evictions"] += 1
+            self._stats["connections_closed"] += 1
+            evicted.append(conn)
+        return evicted
+
+    def getconn(self, timeout: float | None = None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise PoolClosed("Connection pool is closed")
+                evicted = self._evict_idle(time.monotonic())
+                candidate = None
+                open_new = False
+                while candidate is None:
+                    if self._idle:
+                        candidate = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        open_new = True
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeout(
+                                "Timed out after %.1fs waiting for a database connection" % timeout
+                            )
+                        waited = True
+                        self._lock.wait(remaining)
+                        if self._closed:
+                            raise PoolClosed("Connection pool is closed")
+
+            for conn in evicted:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+            if open_new:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            else:
+                conn, released_at = candidate
+                if not self._is_healthy(conn, time.monotonic() - released_at):
+                    with self._lock:
+                        self._stats["health_check_failures"] += 1
+                    self._discard(conn)
+                    continue
+
+            with self._lock:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_time_total"] += time.monotonic() - started
+            DB_CHECKOUT.labels("psycopg2").observe(time.monotonic() - started)
+            return conn
+
+    def putconn(self, conn):
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            # Reads never commit, so most connections come back in a transaction.
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if self._closed:
+                self._size -= 1
+                self._stats["connections_closed"] += 1
+                close_it = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+                close_it = False
+        if close_it:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats["connections_closed"] += len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self._stats)
+            res.update(
+                {
+                    "size": self._size,
+                    "idle": len(self._idle),
+                    "in_use": self._size - len(self._idle),
+                    "min_size": self.min_size,
+                    "max_size": self.max_size,
+                    "closed": self._closed,
+                }
+            )
+            return res
+
+
+class PooledConnection:
+    """
+    Wraps a pooled psycopg2 connection so that close() hands it back to the
+    pool instead of closing the socket. Everything else is delegated.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._conn, name)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    os.getenv("DATABASE_URL"),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    check_after=DB_POOL_CHECK_AFTER,
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def pool_stats() -> dict | None:
+    pool = _pool
+    return pool.stats() if pool is not None else None
+
+
+class DBSession:
+    """
+    Unit of work: one pooled connection and one transaction shared by every
+    model call made while the session is active. The connection is checked out
+    lazily, so requests that never touch the database don't hold one.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn = None
+        self.active = True
+        self.failed = False
+
+    @property
+    def connection(self):
+        if not self.active:
+            raise psycopg2.InterfaceError("database session already finished")
+        if self._conn is None:
+            self._conn = self._pool.getconn()
+        return self._conn
+
+    @property
+    def connection_checked_out(self) -> bool:
+        return self._conn is not None
+
+    def mark_failed(self):
+        self.failed = True
+
+    def finish(self, commit: bool = True):
+        """Commit (or roll back) and return the connection to the pool."""
+        if not self.active:
+            return
+        self.active = False
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            if commit and not self.failed:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            self._pool.putconn(conn)
+
+
+class SessionConnection:
+    """
+    Connection handed to model functions while a DBSession is active.
+    commit() and close() are deferred to the end of the session; rollback()
+    really rolls back and dooms the session so nothing half-done is committed.
+    """
+
+    def __init__(self, session: DBSession):
+        self._session = session
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        self._session.mark_failed()
+        self._session.connection.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._session.connection, name)
+
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("db_session", default=None)
+
+
+def current_session() -> DBSession | None:
+    session = _current_session.get()
+    if session is not None and session.active:
+        return session
+    return None
+
+
+def begin_session() -> tuple[DBSession, contextvars.Token]:
+    session = DBSession(get_pool())
+    return session, _current_session.set(session)
+
+
+def end_session(session: DBSession, token: contextvars.Token, commit: bool = True):
+    try:
+        session.finish(commit=commit)
+    finally:
+        _current_session.reset(token)
+
+
+@contextmanager
+def db_session():
+    """
+    Run a block on one connection and in one transaction. Re-entrant: nested
+    blocks (and request handlers) join the session that is already active.
+
+        with db_session():
+            save_row(...)
+            set_month_plan(...)
+    """
+    session = current_session()
+    if session is not None:
+        yield session
+        return
+
+    session, token = begin_session()
+    try:
+        yield session
+    except BaseException:
+        end_session(session, token, commit=False)
+        raise
+    end_session(session, token, commit=True)
+
 
 def get_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+    session = current_session()
+    if session is not None:
+        return SessionConnection(session)
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
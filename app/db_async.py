@@ -0,0 +1,208 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+
+import asyncpg
+
+from app.db import PoolTimeout, log_slow_query, observe_query, redact_plan, wants_explain
+from app.metrics import DB_CHECKOUT
+
+# async pool settings (separate from the psycopg2 pool in app.db)
+DB_ASYNC_POOL_MIN_SIZE = int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "1"))
+DB_ASYNC_POOL_MAX_SIZE = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "10"))
+DB_ASYNC_POOL_TIMEOUT = float(os.getenv("DB_ASYNC_POOL_TIMEOUT", "10"))
+DB_ASYNC_POOL_MAX_IDLE = float(os.getenv("DB_ASYNC_POOL_MAX_IDLE", "300"))
+
+_pool = None
+_pool_lock = None
+_pool_loop = None
+
+
+async def _init_connection(conn):
+    # Decode json/jsonb to Python objects like psycopg2 does.
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog",
+        )
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    global _pool, _pool_lock, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool_loop is not loop:
+        # Scripts calling asyncio.run() repeatedly: the old loop is gone, so
+        # its connections can only be dropped.
+        try:
+            _pool.terminate()
+        except RuntimeError:
+            pass
+        _pool = _pool_lock = None
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    os.getenv("DATABASE_URL"),
+                    min_size=DB_ASYNC_POOL_MIN_SIZE,
+                    max_size=DB_ASYNC_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=DB_ASYNC_POOL_MAX_IDLE,
+                    init=_init_connection,
+                )
+                _pool_loop = loop
+    return _pool
+
+
+async def close_async_pool():
+    global _pool, _pool_lock
+    pool, _pool, _pool_lock = _pool, None, None
+    if pool is not None:
+        await pool.close()
+
+
+async def _acquire(pool: asyncpg.Pool) -> asyncpg.Connection:
+    started = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=DB_ASYNC_POOL_TIMEOUT)
+        DB_CHECKOUT.labels("asyncpg").observe(time.perf_counter() - started)
+        return conn
+    except asyncio.TimeoutError:
+        raise PoolTimeout(
+            "Timed out after %.1fs waiting for a database connection" % DB_ASYNC_POOL_TIMEOUT
+        )
+
+
+def async_pool_stats() -> dict | None:
+    pool = _pool
+    if pool is None:
+        return None
+    return {
+        "size": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+    }
+
+
+class AsyncDBSession:
+    """
+    Async counterpart of app.db.DBSession: one asyncpg connection and one
+    transaction for everything an async request handler does, acquired lazily.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._conn = None
+        self._tx = None
+        self._lock = asyncio.Lock()
+        self.active = True
+
+    async def connection(self) -> asyncpg.Connection:
+        if not self.active:
+            raise asyncpg.InterfaceError("database session already finished")
+        if self._conn is None:
+            async with self._lock:
+                if self._conn is None:
+                    pool = await get_async_pool()
+                    conn = await _acquire(pool)
+                    try:
+                        tx = conn.transaction()
+                        await tx.start()
+                    except BaseException:
+                        await pool.release(conn)
+                        raise
+                    self._pool, self._conn, self._tx = pool, conn, tx
+        return self._conn
+
+    async def finish(self, commit: bool = True):
+        if not self.active:
+            return
+        self.active = False
+        conn, tx = self._conn, self._tx
+        self._conn = self._tx = None
+        if conn is None:
+            return
+        try:
+            if commit:
+                await tx.commit()
+            else:
+                await tx.rollback()
+        finally:
+            await self._pool.release(conn)
+
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("async_db_session", default=None)
+
+
+def begin_async_session() -> tuple[AsyncDBSession, contextvars.Token]:
+    session = AsyncDBSession()
+    return session, _current_session.set(session)
+
+
+async def end_async_session(session: AsyncDBSession, token: contextvars.Token, commit: bool = True):
+    try:
+        await session.finish(commit=commit)
+    finally:
+        _current_session.reset(token)
+
+
+def _session() -> AsyncDBSession | None:
+    session = _current_session.get()
+    if session is not None and session.active:
+        return session
+    return None
+
+
+async def _traced(conn: asyncpg.Connection, method: str, query: str, args: tuple):
+    # Same request trace and slow-query log as app.db.TracingCursor.
+    started = time.perf_counter()
+    result = await getattr(conn, method)(query, *args)
+    elapsed = time.perf_counter() - started
+    if observe_query(elapsed):
+        plan = None
+        if wants_explain(query):
+            try:
+                # A savepoint inside the session's transaction, so a failing
+                # EXPLAIN doesn't abort it.
+                async with conn.transaction():
+                    plan = redact_plan(r[0] for r in await conn.fetch("EXPLAIN " + query, *args))
+            except asyncpg.PostgresError as e:
+                plan = "EXPLAIN failed: %s" % e
+        log_slow_query(query, args, elapsed, plan)
+    return result
+
+
+async def _run(method: str, query: str, args: tuple):
+    session = _session()
+    if session is not None:
+        conn = await session.connection()
+        return await _traced(conn, method, query, args)
+    # Outside a session each statement runs (and commits) on its own.
+    pool = await get_async_pool()
+    conn = await _acquire(pool)
+    try:
+        return await _traced(conn, method, query, args)
+    finally:
+        await pool.release(conn)
+
+
+async def fetch(query: str, *args) -> list[dict]:
+    return [dict(r) for r in await _run("fetch", query, args)]
+
+
+async def fetchrow(query: str, *args) -> dict | None:
+    row = await _run("fetchrow", query, args)
+    return dict(row) if row is not None else None
+
+
+async def fetchval(query: str, *args):
+    return await _run("fetchval", query, args)
+
+
+async def execute(query: str, *args) -> str:
+    return await _run("execute", query, args)
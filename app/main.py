@@ -1,23 +1,78 @@
-from fastapi import FastAPI, Query, Depends, HTTPException, status, Body
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Query, Depends, HTTPException, status, Body, Request, Response, File, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from datetime import datetime
 
-from app.db import get_connection
-from app.services.row_service import save_row, list_rows
-from app.services.table_view_service import get_table_view
-from app.models.tables import list_tables, create_month_table, get_table_by_template_and_period
+from app.db import get_connection, close_pool, pool_stats, PoolTimeout
+from app.db_async import close_async_pool, async_pool_stats
+from app.metrics import render_metrics
+from app.middleware import CompressionMiddleware, DBSessionMiddleware, MetricsMiddleware
+from app.responses import FastJSONResponse
+from app.services.month_cache import month_cache_stats
+from app.services.realtime import (
+    realtime_stats,
+    serve_websocket,
+    sse_events,
+    start_realtime,
+    stop_realtime,
+)
+from app.services.row_service import list_rows, save_row_async, save_rows, MAX_BULK_ROWS
+from app.services.table_view_service import (
+    etag_matches,
+    get_table_view_async,
+    get_table_view_etag_async,
+)
+from app.models.rows import rebuild_month_totals
+from app.models.tables import (
+    create_month_table,
+    get_table,
+    get_table_by_template_and_period_async,
+    list_table_ids,
+    list_tables,
+)
+from app.services.changes_service import get_changes_async
+from app.services.export_service import EXPORT_MEDIA_TYPES, export_rows
+from app.services.import_service import import_rows
+from app.services.rollup_service import get_rollup_async
 from app.services.auth_service import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
     get_user_by_token,
-    register_user,
+    get_user_by_token_async,
+    register_user_async,
     sanitize_user,
 )
-from app.services.row_service import set_month_plan
+from app.services.row_service import set_month_plan, set_month_plans
+from app.services.formulas import FormulaError
+from app.services.template_service import (
+    get_compiled_template,
+    invalidate_template_cache,
+    sync_typed_columns,
+    template_formulas_of,
+)
+from app.services.password_service import (
+    PasswordHasherBusy,
+    password_stats,
+    shutdown_password_executor,
+)
+
 
-app = FastAPI(title="Coal Reports API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_realtime()
+    yield
+    await stop_realtime()
+    # Drain pooled connections so Postgres sees a clean disconnect on shutdown.
+    close_pool()
+    await close_async_pool()
+    shutdown_password_executor()
+
+
+app = FastAPI(title="Coal Reports API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
   CORSMiddleware,
@@ -32,8 +87,32 @@ app.add_middleware(
   allow_methods=["*"],
   allow_headers=["*"],
 )
+app.add_middleware(DBSessionMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Outermost, so request timings include the commit done by DBSessionMiddleware.
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, try again"},
+    )
+
+
+@app.exception_handler(FormulaError)
+def formula_error_handler(request, exc):
+    # Only views and exports of the template's tables; saves still work.
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+        content={"detail": f"Invalid template formulas: {exc}"},
+    )
+
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+# EventSource and WebSocket clients can't set headers; they pass ?token=.
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 
 class LoginRequest(BaseModel):
@@ -53,6 +132,18 @@ class PlanUpdate(BaseModel):
     ovb_plan_month_m3: float | None = None
 
 
+class BulkRowsRequest(BaseModel):
+    rows: dict[str, dict]  # row_date (YYYY-MM-DD) -> cell values
+
+
+class TablePlanUpdate(PlanUpdate):
+    table_id: int
+
+
+class BulkPlanUpdate(BaseModel):
+    plans: list[TablePlanUpdate]
+
+
 class CreateUserRequest(BaseModel):
     login: str
     name: str
@@ -64,6 +155,44 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     return get_user_by_token(token)
 
 
+async def get_current_user_async(token: str = Depends(oauth2_scheme)):
+    return await get_user_by_token_async(token)
+
+
+async def get_current_user_stream(
+    header_token: str | None = Depends(oauth2_scheme_optional),
+    token: str | None = Query(None),
+):
+    if not (header_token or token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_user_by_token_async(header_token or token)
+
+
+def _parse_plan_update(payload: PlanUpdate):
+    # Normalize month start
+    month_str = payload.month
+    if len(month_str) == 7:  # YYYY-MM
+        month_str = f"{month_str}-01"
+    try:
+        month_start = datetime.fromisoformat(month_str).date().replace(day=1)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid month format. Use YYYY-MM or YYYY-MM-DD.",
+        )
+
+    if payload.prod_plan_month_t is None and payload.ovb_plan_month_m3 is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide at least one plan value to update.",
+        )
+    return month_start
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -83,15 +212,69 @@ def db_test():
     return {"db": "ok", "result": result[0]}
 
 
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/db-stats")
+def db_stats(current_user=Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return {
+        "pool": pool_stats(),
+        "async_pool": async_pool_stats(),
+        "month_cache": month_cache_stats(),
+        "realtime": realtime_stats(),
+    }
+
+
 @app.put("/debug/tables/{table_id}/rows/{row_date}")
-def debug_save_row(
+async def debug_save_row(
     table_id: int,
     row_date: str,
     payload: dict = Body(...),
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_async),
 ):
     user_id = current_user["id"]
-    return save_row(table_id=table_id, row_date=row_date, incoming_data=payload, user_id=user_id)
+    return await save_row_async(table_id=table_id, row_date=row_date, incoming_data=payload, user_id=user_id)
+
+
+@app.put("/tables/{table_id}/rows")
+def save_rows_route(
+    table_id: int,
+    payload: BulkRowsRequest,
+    current_user=Depends(get_current_user),
+):
+    if len(payload.rows) > MAX_BULK_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BULK_ROWS} rows per request",
+        )
+    return save_rows(table_id=table_id, entries=payload.rows, user_id=current_user["id"])
+
+
+@app.post("/tables/{table_id}/import")
+def import_rows_route(
+    table_id: int,
+    file: UploadFile = File(...),
+    fmt: str | None = Query(None, alias="format", pattern="^(csv|xlsx)$"),
+    current_user=Depends(get_current_user),
+):
+    try:
+        get_table(table_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table not found")
+    if fmt is None:
+        fmt = "xlsx" if (file.filename or "").lower().endswith(".xlsx") else "csv"
+    try:
+        return import_rows(table_id=table_id, file=file.file, fmt=fmt, user_id=current_user["id"])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @app.get("/debug/tables/{table_id}/rows")
@@ -104,14 +287,145 @@ def debug_list_rows(
     return list_rows(table_id=table_id, from_date=from_date, to_date=to_date)
 
 
-@app.get("/tables/{table_id}/view")
-def table_view(
+def _export_response(
+    table_ids: list[int],
+    from_date: str,
+    to_date: str,
+    fmt: str,
+    name: str,
+    template_id: int,
+):
+    compiled = get_compiled_template(template_id)
+    formulas = template_formulas_of(compiled)
+    try:
+        body = export_rows(
+            table_ids,
+            from_date,
+            to_date,
+            fmt,
+            schema_json=compiled["template"]["schema_json"],
+            sheet_name=name,
+            formulas=formulas,
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date, use YYYY-MM-DD",
+        )
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}_{from_date}_{to_date}.{fmt}"'},
+    )
+
+
+@app.get("/tables/{table_id}/export")
+def export_table_rows(
     table_id: int,
     from_date: str = Query(..., alias="from"),
     to_date: str = Query(..., alias="to"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|json|csv|xlsx)$"),
     current_user=Depends(get_current_user),
 ):
-    return get_table_view(table_id=table_id, from_date=from_date, to_date=to_date)
+    try:
+        table = get_table(table_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Table not found")
+    return _export_response(
+        [table_id], from_date, to_date, fmt, f"table_{table_id}", table["template_id"]
+    )
+
+
+@app.get("/templates/{template_id}/export")
+def export_template_rows(
+    template_id: int,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|json|csv|xlsx)$"),
+    current_user=Depends(get_current_user),
+):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    # Every month table of the template, in one stream.
+    table_ids = list_table_ids(template_id)
+    return _export_response(
+        table_ids, from_date, to_date, fmt, f"template_{template_id}", template_id
+    )
+
+
+@app.get("/templates/rollup")
+async def templates_rollup(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    period: str = Query("month", pattern="^(month|year|total)$"),
+    template_id: int | None = None,
+    current_user=Depends(get_current_user_async),
+):
+    """Fact/plan totals per template and month, year or the whole period."""
+    try:
+        rows = await get_rollup_async(from_date, to_date, period, template_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return FastJSONResponse({"from": from_date, "to": to_date, "period": period, "rows": rows})
+
+
+@app.get("/tables/{table_id}/view")
+async def table_view(
+    table_id: int,
+    request: Request,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    current_user=Depends(get_current_user_async),
+):
+    etag = await get_table_view_etag_async(table_id=table_id, from_date=from_date, to_date=to_date)
+    headers = None
+    if etag is not None:
+        # Clients must revalidate every time; unchanged views cost one query.
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    view = await get_table_view_async(table_id=table_id, from_date=from_date, to_date=to_date)
+    # Returned as a response so the rows are encoded once, without
+    # FastAPI's jsonable_encoder copy.
+    return FastJSONResponse(view, headers=headers)
+
+
+@app.get("/tables/{table_id}/changes")
+async def table_changes(
+    table_id: int,
+    since: str | None = None,
+    current_user=Depends(get_current_user_async),
+):
+    try:
+        return FastJSONResponse(await get_changes_async(table_id=table_id, since=since))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+@app.get("/tables/{table_id}/events")
+async def table_events_sse(
+    table_id: int,
+    current_user=Depends(get_current_user_stream),
+):
+    # Cells changed by other users, pushed as they are committed.
+    return StreamingResponse(
+        sse_events(table_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/tables/{table_id}/ws")
+async def table_events_ws(websocket: WebSocket, table_id: int, token: str | None = None):
+    try:
+        await get_current_user_stream(header_token=None, token=token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await serve_websocket(websocket, table_id)
 
 
 @app.get("/tables")
@@ -163,13 +477,13 @@ def create_month_route(
 
 
 @app.get("/tables/current")
-def current_table(
+async def current_table(
     template_id: int,
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_async),
 ):
     today = datetime.utcnow().date()
     period_start = today.replace(day=1).isoformat()
-    table = get_table_by_template_and_period(template_id, period_start)
+    table = await get_table_by_template_and_period_async(template_id, period_start)
     if not table:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -189,23 +503,7 @@ def update_plan(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required",
         )
-    # Normalize month start
-    month_str = payload.month
-    if len(month_str) == 7:  # YYYY-MM
-        month_str = f"{month_str}-01"
-    try:
-        month_start = datetime.fromisoformat(month_str).date().replace(day=1)
-    except ValueError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid month format. Use YYYY-MM or YYYY-MM-DD.",
-        )
-
-    if payload.prod_plan_month_t is None and payload.ovb_plan_month_m3 is None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Provide at least one plan value to update.",
-        )
+    month_start = _parse_plan_update(payload)
 
     set_month_plan(
         table_id=table_id,
@@ -217,9 +515,39 @@ def update_plan(
     return {"status": "ok"}
 
 
+@app.put("/tables/plans")
+def update_plans(
+    payload: BulkPlanUpdate,
+    current_user=Depends(get_current_user),
+):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    plans = [
+        {
+            "table_id": plan.table_id,
+            "month_start": _parse_plan_update(plan),
+            "prod_plan_month": plan.prod_plan_month_t,
+            "ovb_plan_month": plan.ovb_plan_month_m3,
+        }
+        for plan in payload.plans
+    ]
+    set_month_plans(plans, user_id=current_user["id"])
+    return {"status": "ok", "updated": len(plans)}
+
+
 @app.post("/auth/login")
-def auth_login(payload: LoginRequest):
-    user = authenticate_user(login=payload.login, password=payload.password)
+async def auth_login(payload: LoginRequest):
+    try:
+        user = await authenticate_user_async(login=payload.login, password=payload.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, try again",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -229,25 +557,85 @@ def auth_login(payload: LoginRequest):
     return {"access_token": token, "token_type": "bearer", "user": sanitize_user(user)}
 
 
+@app.get("/auth/stats")
+def auth_stats(current_user=Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return password_stats()
+
+
 @app.get("/me")
-def me(current_user=Depends(get_current_user)):
+async def me(current_user=Depends(get_current_user_async)):
     return sanitize_user(current_user)
 
 
 @app.post("/admin/users")
-def create_user_admin(
+async def create_user_admin(
     payload: CreateUserRequest,
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_async),
 ):
     if not current_user.get("is_admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required",
         )
-    user = register_user(
-        email=payload.login,
-        name=payload.name,
-        password=payload.password,
-        is_admin=payload.is_admin,
-    )
+    try:
+        user = await register_user_async(
+            email=payload.login,
+            name=payload.name,
+            password=payload.password,
+            is_admin=payload.is_admin,
+        )
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password checks in progress, try again",
+            headers={"Retry-After": "1"},
+        )
     return sanitize_user(user)
+
+
+@app.post("/admin/templates/cache/invalidate")
+def invalidate_templates_admin(
+    template_id: int | None = None,
+    current_user=Depends(get_current_user),
+):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    invalidate_template_cache(template_id)
+    if template_id is not None:
+        # Compile right away so formula errors show up here, not in views.
+        try:
+            template_formulas_of(get_compiled_template(template_id))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"status": "ok"}
+
+
+@app.post("/admin/month-totals/rebuild")
+def rebuild_month_totals_admin(
+    table_id: int | None = None,
+    current_user=Depends(get_current_user),
+):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return {"status": "ok", "tables": rebuild_month_totals(table_id)}
+
+
+@app.post("/admin/typed-columns/sync")
+def sync_typed_columns_admin(current_user=Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return sync_typed_columns()
@@ -0,0 +1,105 @@
+"""
+Prometheus metrics, exposed at GET /metrics.
+
+With several worker processes set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers; /metrics then aggregates all of them.
+"""
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Request latencies are mostly milliseconds; bcrypt and exports run longer.
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code.",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response status is sent, by route template.",
+    ["method", "route"],
+    buckets=_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled.",
+    multiprocess_mode="livesum",
+)
+DB_QUERY = Histogram(
+    "db_query_duration_seconds",
+    "Time spent in model functions, including waiting for a connection.",
+    ["function"],
+    buckets=_BUCKETS,
+)
+DB_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from a pool, including opening one.",
+    ["pool"],
+    buckets=_BUCKETS,
+)
+DB_CONNECT = Histogram(
+    "db_connect_seconds",
+    "Time to open a new database connection.",
+    ["pool"],
+    buckets=_BUCKETS,
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements run by one HTTP request.",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+PASSWORD_HASH = Histogram(
+    "password_hash_seconds",
+    "bcrypt time per operation (hash or verify).",
+    ["operation"],
+    buckets=_BUCKETS,
+)
+
+
+def timed_db(fn):
+    """Record the duration of a (sync or async) model function in DB_QUERY."""
+    histogram = DB_QUERY.labels(fn.__name__)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,217 @@
+import os
+import time
+import zlib
+
+import brotli
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import IdentityResponder
+
+from app.db import DB_SERVER_TIMING, begin_session, begin_trace, end_session, end_trace
+from app.db_async import begin_async_session, end_async_session
+from app.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS
+
+# Responses smaller than this go out uncompressed.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Levels that compress a year view ~10x in a few ms; higher ones cost more
+# CPU than they save on the wire.
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Never compressed: server-sent events (compressors buffer) and formats that
+# are compressed already.
+UNCOMPRESSED_TYPES = (
+    "text/event-stream",
+    "application/vnd.openxmlformats-officedocument",
+    "application/zip",
+    "image/",
+)
+
+
+class DBSessionMiddleware:
+    """
+    Opens a DBSession (and its async counterpart) for every HTTP request so
+    all model calls made while handling it share one connection and one
+    transaction per driver. Both are checked out lazily.
+
+    The transaction is committed right before the response status is sent
+    (rolled back for 4xx/5xx or when the handler raises), so a failed commit
+    still turns into an error response instead of a silent data loss.
+
+    It also traces the statements the request runs: their count and total
+    time are sent in a Server-Timing header (DB_SERVER_TIMING=1), so N+1
+    patterns show up in the browser's network panel.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, trace_token = begin_trace()
+        session, token = begin_session()
+        async_session, async_token = begin_async_session()
+        finished = False
+
+        async def finish(commit: bool):
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            try:
+                await async_session.finish(commit)
+            finally:
+                if session.connection_checked_out:
+                    await run_in_threadpool(session.finish, commit)
+                else:
+                    session.finish(commit)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                await finish(message["status"] < 400)
+                if DB_SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await finish(False)
+            await end_async_session(async_session, async_token)
+            end_session(session, token)
+            end_trace(trace_token)
+            trace.finish()
+
+
+class MetricsMiddleware:
+    """
+    Request count by status, latency until the response status is sent and
+    in-flight requests, labelled with the route template (/tables/{table_id}/view)
+    so ids don't multiply the series. Requests matching no route are
+    labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        method = scope["method"]
+        recorded = False
+
+        def record(status_code: int):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The handler raised before sending anything; the server answers 500.
+            record(500)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings an Accept-Encoding header allows (q > 0), lowercased."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class _Responder(IdentityResponder):
+    """
+    Starlette's responder (minimum size, Vary, streaming) with our excluded
+    content types and a compressor created on first use, so responses that
+    end up uncompressed don't pay for it.
+    """
+
+    def __init__(self, app, minimum_size: int, level: int = 0):
+        super().__init__(app, minimum_size)
+        self.level = level
+        self.compressor = None
+
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = content_type.startswith(UNCOMPRESSED_TYPES)
+
+
+class _GZipResponder(_Responder):
+    content_encoding = "gzip"
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self.compressor is None:
+            # wbits 31: deflate in a gzip container.
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        out = self.compressor.compress(body)
+        # Streamed chunks are flushed so clients see rows as they arrive.
+        return out + self.compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _BrotliResponder(_Responder):
+    content_encoding = "br"
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self.compressor is None:
+            self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=self.level)
+        out = self.compressor.process(body)
+        return out + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least COMPRESSION_MIN_SIZE bytes with
+    brotli or gzip, whichever the client accepts (brotli preferred), and
+    adds Vary: Accept-Encoding. Streaming responses are compressed chunk by
+    chunk; server-sent events and already compressed formats are left alone.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if "br" in accepted:
+            responder = _BrotliResponder(self.app, COMPRESSION_MIN_SIZE, BROTLI_QUALITY)
+        elif "gzip" in accepted:
+            responder = _GZipResponder(self.app, COMPRESSION_MIN_SIZE, GZIP_LEVEL)
+        else:
+            responder = _Responder(self.app, COMPRESSION_MIN_SIZE)
+        await responder(scope, receive, send)
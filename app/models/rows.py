@@ -1,39 +1,444 @@
+import calendar
 import json
-from app.db import get_connection
+import os
+from datetime import date as dt_date
 
-def upsert_row(table_id: int, row_date: str, data: dict, user_id: int) -> dict:
-    query = """
+from psycopg2.extras import execute_values
+
+from app import db_async
+from app.db import get_connection, get_pool
+from app.metrics import timed_db
+from app.models.typed_columns import get_typed_keys, get_typed_keys_async, xl_to_float8_sql
+from app.utils.numbers import typed_column
+
+
+def _as_date(value) -> dt_date:
+    # asyncpg wants real date objects for DATE parameters.
+    if isinstance(value, dt_date):
+        return value
+    return dt_date.fromisoformat(str(value))
+
+
+# Stored columns of table_rows. Typed columns (num_*) are only selected where
+# the values are computed with (see _typed_select), never returned to clients.
+ROW_COLUMNS = "id, table_id, row_date, data, created_by, updated_by, created_at, updated_at, version"
+
+
+def _typed_select(typed: frozenset, keys) -> str:
+    # Typed columns of the data keys the caller computes with, so the
+    # compute engine reads them instead of parsing data.
+    return "".join(f", {typed_column(key)}" for key in keys if key in typed)
+
+
+# Row changes are announced on this channel when their transaction commits
+# (see app.services.realtime).
+ROW_EVENTS_CHANNEL = os.getenv("ROW_EVENTS_CHANNEL", "table_rows")
+
+
+def _row_event(table_id: int, date_from, date_to, version: int | None = None) -> str:
+    event = {"table_id": table_id, "from": str(date_from), "to": str(date_to)}
+    if version is not None:
+        event["version"] = version
+    return json.dumps(event)
+
+
+def notify_rows_changed(cur, table_id: int, date_from, date_to, version: int | None = None):
+    cur.execute(
+        "SELECT pg_notify(%s, %s);",
+        (ROW_EVENTS_CHANNEL, _row_event(table_id, date_from, date_to, version)),
+    )
+
+
+async def notify_rows_changed_async(table_id: int, date_from, date_to, version: int | None = None):
+    await db_async.execute(
+        "SELECT pg_notify($1, $2);",
+        ROW_EVENTS_CHANNEL,
+        _row_event(table_id, date_from, date_to, version),
+    )
+
+
+def _month_range(date_from, date_to) -> tuple[dt_date, dt_date]:
+    first = _as_date(date_from).replace(day=1)
+    last = _as_date(date_to)
+    return first, last.replace(day=calendar.monthrange(last.year, last.month)[1])
+
+
+def _month_totals_lock_query(ph: tuple) -> str:
+    # Concurrent writers of one month take turns, so each refresh reads the
+    # rows committed before it instead of overwriting a newer summary.
+    table_id, month_from, month_to = ph
+    return f"""
+    SELECT pg_advisory_xact_lock({table_id}, (extract(year FROM m) * 12 + extract(month FROM m))::int)
+    FROM generate_series({month_from}::date, {month_to}::date, interval '1 month') AS m
+    ORDER BY m;
+    """
+
+
+def _month_totals_query(ph: tuple, typed: frozenset) -> str:
+    # Recompute table_month_totals for every month in [month_from, month_to]
+    # from the running totals of its last row.
+    table_id, month_from, month_to = ph
+    return f"""
+    {_running_totals_ctes((table_id, month_from, month_to), typed)},
+    last AS (
+      SELECT DISTINCT ON (_month) totals.*, count(*) OVER (PARTITION BY _month) AS _rows
+      FROM totals
+      ORDER BY _month, row_date DESC
+    ),
+    emptied AS (
+      DELETE FROM table_month_totals s
+      WHERE s.table_id = {table_id}
+        AND s.month BETWEEN {month_from} AND {month_to}
+        AND NOT EXISTS (SELECT 1 FROM last WHERE last._month = s.month)
+    )
+    INSERT INTO table_month_totals (
+      table_id,
+      template_id,
+      month,
+      row_count,
+      last_row_date,
+      prod_fact_t,
+      prod_plan_month_t,
+      prod_plan_to_date_t,
+      ovb_fact_m3,
+      ovb_plan_month_m3,
+      ovb_plan_to_date_m3
+    )
+    SELECT
+      l.table_id,
+      t.template_id,
+      l._month,
+      l._rows,
+      l.row_date,
+      l._prod_fact_to_date,
+      l._prod_plan_month,
+      l._prod_plan_to_date,
+      l._ovb_fact_to_date,
+      l._ovb_plan_month,
+      l._ovb_plan_to_date
+    FROM last l
+    JOIN tables t ON t.id = l.table_id
+    ON CONFLICT (table_id, month)
+    DO UPDATE SET
+      row_count = EXCLUDED.row_count,
+      last_row_date = EXCLUDED.last_row_date,
+      prod_fact_t = EXCLUDED.prod_fact_t,
+      prod_plan_month_t = EXCLUDED.prod_plan_month_t,
+      prod_plan_to_date_t = EXCLUDED.prod_plan_to_date_t,
+      ovb_fact_m3 = EXCLUDED.ovb_fact_m3,
+      ovb_plan_month_m3 = EXCLUDED.ovb_plan_month_m3,
+      ovb_plan_to_date_m3 = EXCLUDED.ovb_plan_to_date_m3,
+      updated_at = now();
+    """
+
+
+def refresh_month_totals(cur, table_id: int, date_from, date_to):
+    """
+    Bring table_month_totals up to date for the months touched by a write
+    between date_from and date_to, in the writer's transaction.
+    """
+    month_from, month_to = _month_range(date_from, date_to)
+    params = {"table_id": table_id, "month_from": month_from, "month_to": month_to}
+    ph = ("%(table_id)s", "%(month_from)s", "%(month_to)s")
+    cur.execute(_month_totals_lock_query(ph), params)
+    cur.execute(_month_totals_query(ph, get_typed_keys()), params)
+
+
+async def refresh_month_totals_async(table_id: int, date_from, date_to):
+    month_from, month_to = _month_range(date_from, date_to)
+    ph = ("$1", "$2", "$3")
+    await db_async.execute(_month_totals_lock_query(ph), table_id, month_from, month_to)
+    typed = await get_typed_keys_async()
+    await db_async.execute(_month_totals_query(ph, typed), table_id, month_from, month_to)
+
+
+def _upsert_query(merge: bool, placeholders: tuple) -> str:
+    data_expr = "table_rows.data || EXCLUDED.data" if merge else "EXCLUDED.data"
+    return """
     INSERT INTO table_rows (
       table_id,
       row_date,
       data,
       created_by
     )
-    VALUES (%s, %s, %s::jsonb, %s)
+    VALUES ({0}, {1}, {2}::jsonb, {3})
     ON CONFLICT (table_id, row_date)
     DO UPDATE SET
-      data = EXCLUDED.data,
+      data = {data_expr},
       updated_by = EXCLUDED.created_by,
       updated_at = now(),
       version = table_rows.version + 1
-    RETURNING *;
+    RETURNING {columns};
+    """.format(*placeholders, data_expr=data_expr, columns=ROW_COLUMNS)
+
+
+@timed_db
+def upsert_row(table_id: int, row_date: str, data: dict, user_id: int, merge: bool = False) -> dict:
     """
+    Insert or update the row for (table_id, row_date) and return it.
+
+    With merge=True the incoming keys are merged into the stored jsonb by
+    Postgres (data || EXCLUDED.data) instead of replacing the whole document,
+    so callers don't need to read the row first and concurrent edits of
+    different cells don't overwrite each other.
+    """
+    query = _upsert_query(merge, ("%s",) * 4)
 
     conn = get_connection()
     try:
         with conn.cursor() as cur:
             cur.execute(query, (table_id, row_date, json.dumps(data), user_id))
-            row = cur.fetchone()
+            row = dict(zip([desc[0] for desc in cur.description], cur.fetchone()))
+            notify_rows_changed(cur, table_id, row["row_date"], row["row_date"], row["version"])
+            refresh_month_totals(cur, table_id, row["row_date"], row["row_date"])
+            conn.commit()
+            return row
+    finally:
+        conn.close()
+
+
+@timed_db
+async def upsert_row_async(table_id: int, row_date: str, data: dict, user_id: int, merge: bool = False) -> dict:
+    query = _upsert_query(merge, ("$1", "$2", "$3", "$4"))
+    row = await db_async.fetchrow(query, table_id, _as_date(row_date), data, user_id)
+    await notify_rows_changed_async(table_id, row["row_date"], row["row_date"], row["version"])
+    await refresh_month_totals_async(table_id, row["row_date"], row["row_date"])
+    return row
+
+
+@timed_db
+def upsert_rows(table_id: int, rows: list[tuple], user_id: int, merge: bool = False) -> list[dict]:
+    """
+    Set-based upsert_row: rows is a list of (row_date, data) pairs with unique
+    dates, written with a single INSERT ... ON CONFLICT statement.
+    Returns the stored rows ordered by row_date.
+    """
+    if not rows:
+        return []
+    data_expr = "table_rows.data || EXCLUDED.data" if merge else "EXCLUDED.data"
+    query = f"""
+    INSERT INTO table_rows (
+      table_id,
+      row_date,
+      data,
+      created_by
+    )
+    VALUES %s
+    ON CONFLICT (table_id, row_date)
+    DO UPDATE SET
+      data = {data_expr},
+      updated_by = EXCLUDED.created_by,
+      updated_at = now(),
+      version = table_rows.version + 1
+    RETURNING {ROW_COLUMNS};
+    """
+    # Lock rows in date order so concurrent batches can't deadlock each other.
+    values = [
+        (table_id, row_date, json.dumps(data), user_id)
+        for row_date, data in sorted(rows, key=lambda r: str(r[0]))
+    ]
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            stored = execute_values(
+                cur,
+                query,
+                values,
+                template="(%s, %s, %s::jsonb, %s)",
+                page_size=len(values),
+                fetch=True,
+            )
             colnames = [desc[0] for desc in cur.description]
+            res = sorted((dict(zip(colnames, row)) for row in stored), key=lambda r: r["row_date"])
+            notify_rows_changed(cur, table_id, res[0]["row_date"], res[-1]["row_date"])
+            refresh_month_totals(cur, table_id, res[0]["row_date"], res[-1]["row_date"])
             conn.commit()
-            return dict(zip(colnames, row))
+            return res
     finally:
         conn.close()
 
 
-def get_rows(table_id: int, date_from: str, date_to: str) -> list[dict]:
+class _CopySource:
+    """File-like object feeding COPY ... FROM STDIN from an iterator of lines."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buf = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buf) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buf += line
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+_encode_json = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def _copy_line(line: int, row_date, data: dict) -> str:
+    # COPY text format: tab separated, backslashes escaped. The JSON encoder
+    # already escapes tabs and newlines inside strings.
+    payload = _encode_json(data).replace("\\", "\\\\")
+    return f"{line}\t{row_date}\t{payload}\n"
+
+
+@timed_db
+def copy_merge_rows(table_id: int, rows, user_id: int) -> dict:
+    """
+    Bulk merge for imports. rows is an iterable of (line, row_date, data),
+    streamed with COPY into a temporary staging table and merged into
+    table_rows with one INSERT ... ON CONFLICT (data || EXCLUDED.data, like
+    upsert_row(merge=True)). Several lines for one date are merged in line
+    order. Returns {"inserted": n, "updated": n}.
+    """
     query = """
-    SELECT *
+    WITH counted AS (
+      SELECT s.*, count(*) OVER (PARTITION BY s.row_date) AS n
+      FROM import_rows s
+    ),
+    merged AS (
+      SELECT row_date, data
+      FROM counted
+      WHERE n = 1 AND data <> '{}'::jsonb
+      UNION ALL
+      -- only dates given on several lines pay for merging key by key
+      SELECT c.row_date, jsonb_object_agg(e.key, e.value ORDER BY c.line)
+      FROM counted c, jsonb_each(c.data) e
+      WHERE c.n > 1
+      GROUP BY c.row_date
+    ),
+    written AS (
+      INSERT INTO table_rows (
+        table_id,
+        row_date,
+        data,
+        created_by
+      )
+      SELECT %(table_id)s, row_date, data, %(user_id)s
+      FROM merged
+      ORDER BY row_date
+      ON CONFLICT (table_id, row_date)
+      DO UPDATE SET
+        data = table_rows.data || EXCLUDED.data,
+        updated_by = EXCLUDED.created_by,
+        updated_at = now(),
+        version = table_rows.version + 1
+      RETURNING row_date, (xmax = 0) AS inserted
+    )
+    SELECT
+      count(*) FILTER (WHERE inserted) AS inserted,
+      count(*) FILTER (WHERE NOT inserted) AS updated,
+      min(row_date),
+      max(row_date)
+    FROM written;
+    """
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            # pg_temp: never a real import_rows table on the search_path.
+            cur.execute("DROP TABLE IF EXISTS pg_temp.import_rows;")
+            cur.execute(
+                "CREATE TEMP TABLE import_rows (line integer, row_date date, data jsonb) ON COMMIT DROP;"
+            )
+            cur.copy_expert(
+                "COPY import_rows (line, row_date, data) FROM STDIN",
+                _CopySource(_copy_line(*row) for row in rows),
+            )
+            cur.execute(query, {"table_id": table_id, "user_id": user_id})
+            inserted, updated, first, last = cur.fetchone()
+            if first is not None:
+                notify_rows_changed(cur, table_id, first, last)
+                refresh_month_totals(cur, table_id, first, last)
+            conn.commit()
+            return {"inserted": inserted, "updated": updated}
+    finally:
+        conn.close()
+
+
+@timed_db
+def patch_rows_in_range(
+    table_id: int,
+    date_from: str,
+    date_to: str,
+    patch: dict,
+    user_id: int,
+    stub_date: str | None = None,
+) -> list[dict]:
+    """
+    Merge `patch` into the data of every row of the table between date_from
+    and date_to in one UPDATE. When the range has no rows and stub_date is
+    given, a row holding just the patch is inserted on stub_date by the same
+    statement. Returns the touched rows ordered by row_date.
+    """
+    query = f"""
+    WITH updated AS (
+      UPDATE table_rows
+      SET
+        data = table_rows.data || %(patch)s::jsonb,
+        updated_by = %(user_id)s,
+        updated_at = now(),
+        version = table_rows.version + 1
+      WHERE table_id = %(table_id)s AND row_date BETWEEN %(date_from)s AND %(date_to)s
+      RETURNING {ROW_COLUMNS}
+    ),
+    inserted AS (
+      INSERT INTO table_rows (
+        table_id,
+        row_date,
+        data,
+        created_by
+      )
+      SELECT %(table_id)s, %(stub_date)s, %(patch)s::jsonb, %(user_id)s
+      WHERE %(stub_date)s IS NOT NULL AND NOT EXISTS (SELECT 1 FROM updated)
+      ON CONFLICT (table_id, row_date)
+      DO UPDATE SET
+        data = table_rows.data || EXCLUDED.data,
+        updated_by = EXCLUDED.created_by,
+        updated_at = now(),
+        version = table_rows.version + 1
+      RETURNING {ROW_COLUMNS}
+    )
+    SELECT * FROM updated
+    UNION ALL
+    SELECT * FROM inserted
+    ORDER BY row_date;
+    """
+    params = {
+        "table_id": table_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "patch": json.dumps(patch),
+        "user_id": user_id,
+        "stub_date": stub_date,
+    }
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+            if rows:
+                notify_rows_changed(cur, table_id, date_from, date_to)
+                refresh_month_totals(cur, table_id, date_from, date_to)
+            conn.commit()
+            return [dict(zip(colnames, row)) for row in rows]
+    finally:
+        conn.close()
+
+
+@timed_db
+def get_rows(table_id: int, date_from: str, date_to: str, keys=()) -> list[dict]:
+    # keys: data keys to also read from their typed columns, where they exist.
+    query = f"""
+    SELECT {ROW_COLUMNS}{_typed_select(get_typed_keys(), keys)}
     FROM table_rows
     WHERE table_id = %s AND row_date BETWEEN %s AND %s
     ORDER BY row_date;
@@ -50,9 +455,300 @@ def get_rows(table_id: int, date_from: str, date_to: str) -> list[dict]:
         conn.close()
 
 
-def get_row(table_id: int, row_date: str) -> dict | None:
-    query = """
+def iter_rows(table_ids: list[int], date_from: str, date_to: str, fetch_size: int = 2000, keys=()):
+    """
+    Yield the rows of several tables between date_from and date_to ordered by
+    (table_id, row_date), fetch_size at a time through a named (server-side)
+    cursor, so memory stays flat whatever the range. keys as for get_rows.
+
+    Uses its own pooled connection rather than the request session: the
+    generator is consumed while the response streams, after the session ended.
+    """
+    query = f"""
+    SELECT {ROW_COLUMNS}{_typed_select(get_typed_keys(), keys)}
+    FROM table_rows
+    WHERE table_id = ANY(%s) AND row_date BETWEEN %s AND %s
+    ORDER BY table_id, row_date;
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name="iter_rows") as cur:
+            cur.itersize = fetch_size
+            cur.execute(query, (list(table_ids), date_from, date_to))
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                colnames = [desc[0] for desc in cur.description]
+                for row in rows:
+                    yield dict(zip(colnames, row))
+    finally:
+        # putconn rolls back the read-only transaction the cursor lived in.
+        pool.putconn(conn)
+
+
+@timed_db
+async def get_rows_async(table_id: int, date_from: str, date_to: str, keys=()) -> list[dict]:
+    query = f"""
+    SELECT {ROW_COLUMNS}{_typed_select(await get_typed_keys_async(), keys)}
+    FROM table_rows
+    WHERE table_id = $1 AND row_date BETWEEN $2 AND $3
+    ORDER BY row_date;
+    """
+    return await db_async.fetch(query, table_id, _as_date(date_from), _as_date(date_to))
+
+
+def num_sql(key: str, source: str = "data") -> str:
+    """
+    SQL expression reading `key` from a jsonb column as float8 with the same
+    rules as app.utils.numbers.to_number (see typed_columns.xl_to_float8_sql).
+    """
+    if not key.replace("_", "").isalnum():
+        raise ValueError(f"Unsupported key: {key}")
+    return xl_to_float8_sql(f"{source} -> '{key}'", f"{source} ->> '{key}'")
+
+
+# Helper columns added by the running totals query; popped before returning rows.
+RUNNING_TOTAL_COLUMNS = (
+    "_prod_fact_to_date",
+    "_ovb_fact_to_date",
+    "_prod_plan_to_date",
+    "_ovb_plan_to_date",
+    "_prod_plan_day",
+    "_ovb_plan_day",
+)
+
+
+def _num(key: str, typed: frozenset) -> str:
+    # The typed column when there is one, otherwise parse the jsonb value.
+    return f"r.{typed_column(key)}" if key in typed else num_sql(key, "r.data")
+
+
+def _running_totals_ctes(ph: tuple, typed: frozenset) -> str:
+    # ph: placeholders for table_id, month_start, date_to. Defines base,
+    # plans, per_day and totals (running sums for every row read).
+    table_id, month_start, date_to = ph
+    columns = ", ".join(f"r.{c}" for c in ROW_COLUMNS.split(", "))
+    return f"""
+    WITH base AS (
+      SELECT
+        {columns},
+        date_trunc('month', r.row_date)::date AS _month,
+        {_num("prod_fact_day_t", typed)} AS _prod_day,
+        {_num("ovb_fact_day_m3", typed)} AS _ovb_day,
+        {_num("prod_plan_to_date_t", typed)} AS _prod_plan,
+        {_num("ovb_plan_to_date_m3", typed)} AS _ovb_plan
+      FROM table_rows r
+      WHERE r.table_id = {table_id} AND r.row_date BETWEEN {month_start} AND {date_to}
+    ),
+    plans AS (
+      -- month plan = first value seen so far in the month, like compute_engine
+      SELECT
+        base.*,
+        (array_agg(_prod_plan) FILTER (WHERE _prod_plan IS NOT NULL) OVER w)[1] AS _prod_plan_month,
+        (array_agg(_ovb_plan) FILTER (WHERE _ovb_plan IS NOT NULL) OVER w)[1] AS _ovb_plan_month,
+        extract(day FROM _month + interval '1 month - 1 day')::float8 AS _days
+      FROM base
+      WINDOW w AS (PARTITION BY _month ORDER BY row_date ROWS UNBOUNDED PRECEDING)
+    ),
+    per_day AS (
+      SELECT
+        plans.*,
+        COALESCE(_prod_plan_month, 0.0) / _days AS _prod_plan_day,
+        COALESCE(_ovb_plan_month, 0.0) / _days AS _ovb_plan_day
+      FROM plans
+    ),
+    totals AS (
+      SELECT
+        per_day.*,
+        SUM(COALESCE(_prod_day, 0.0)) OVER w AS _prod_fact_to_date,
+        SUM(COALESCE(_ovb_day, 0.0)) OVER w AS _ovb_fact_to_date,
+        SUM(_prod_plan_day) OVER w AS _prod_plan_to_date,
+        SUM(_ovb_plan_day) OVER w AS _ovb_plan_to_date
+      FROM per_day
+      WINDOW w AS (PARTITION BY _month ORDER BY row_date ROWS UNBOUNDED PRECEDING)
+    )"""
+
+
+def _running_totals_query(ph: tuple, typed: frozenset) -> str:
+    # ph: placeholders for table_id, month_start, date_from, date_to
+    table_id, month_start, date_from, date_to = ph
+    return f"""
+    {_running_totals_ctes((table_id, month_start, date_to), typed)}
     SELECT *
+    FROM totals
+    WHERE row_date >= {date_from}
+    ORDER BY row_date;
+    """
+
+
+_RUNNING_TOTALS_DROP = (
+    "_month",
+    "_days",
+    "_prod_day",
+    "_ovb_day",
+    "_prod_plan",
+    "_ovb_plan",
+    "_prod_plan_month",
+    "_ovb_plan_month",
+)
+
+
+def _strip_internal(row: dict) -> dict:
+    for col in _RUNNING_TOTALS_DROP:
+        row.pop(col, None)
+    return row
+
+
+@timed_db
+def get_rows_with_running_totals(
+    table_id: int,
+    month_start: str,
+    date_from: str,
+    date_to: str,
+) -> list[dict]:
+    """
+    Rows between date_from and date_to with running to-date sums computed by
+    Postgres over the rows from month_start on (see RUNNING_TOTAL_COLUMNS).
+    Sums and plans reset at every month boundary.
+    """
+    query = _running_totals_query(
+        ("%(table_id)s", "%(month_start)s", "%(date_from)s", "%(date_to)s"),
+        get_typed_keys(),
+    )
+    params = {
+        "table_id": table_id,
+        "month_start": month_start,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+            return [_strip_internal(dict(zip(colnames, row))) for row in rows]
+    finally:
+        conn.close()
+
+
+@timed_db
+async def get_rows_with_running_totals_async(
+    table_id: int,
+    month_start: str,
+    date_from: str,
+    date_to: str,
+) -> list[dict]:
+    query = _running_totals_query(("$1", "$2", "$3", "$4"), await get_typed_keys_async())
+    rows = await db_async.fetch(
+        query,
+        table_id,
+        _as_date(month_start),
+        _as_date(date_from),
+        _as_date(date_to),
+    )
+    return [_strip_internal(row) for row in rows]
+
+
+@timed_db
+async def get_view_validator_async(table_id: int, date_from: str, date_to: str) -> dict | None:
+    """
+    Cheap change detector for a table view: table metadata plus row count,
+    version sum/max and last update over the date range, in one indexed query.
+    None when the table does not exist.
+    """
+    query = """
+    SELECT
+      t.id,
+      t.template_id,
+      t.name,
+      t.is_archived,
+      count(r.row_date) AS row_count,
+      coalesce(sum(r.version), 0) AS version_sum,
+      max(r.version) AS max_version,
+      max(r.updated_at) AS max_updated_at
+    FROM tables t
+    LEFT JOIN table_rows r
+      ON r.table_id = t.id AND r.row_date BETWEEN $2 AND $3
+    WHERE t.id = $1
+    GROUP BY t.id, t.template_id, t.name, t.is_archived;
+    """
+    return await db_async.fetchrow(query, table_id, _as_date(date_from), _as_date(date_to))
+
+
+@timed_db
+async def get_changed_rows_async(table_id: int, since, limit: int) -> list[dict]:
+    """
+    (row_date, version, updated_at) of rows updated after `since`, oldest
+    change first, at most `limit`. Uses the (table_id, updated_at) index.
+    """
+    query = """
+    SELECT row_date, version, updated_at
+    FROM table_rows
+    WHERE table_id = $1 AND updated_at > $2
+    ORDER BY updated_at, row_date
+    LIMIT $3;
+    """
+    return await db_async.fetch(query, table_id, since, limit)
+
+
+@timed_db
+async def get_db_time_async():
+    return await db_async.fetchval("SELECT clock_timestamp();")
+
+
+_MONTH_VALIDATORS_QUERY = """
+SELECT
+  date_trunc('month', row_date)::date AS month,
+  count(*) AS row_count,
+  sum(version) AS version_sum,
+  max(updated_at) AS max_updated_at
+FROM table_rows
+WHERE table_id = {0} AND row_date BETWEEN {1} AND {2}
+GROUP BY 1;
+"""
+
+
+def _month_validators(rows) -> dict:
+    return {
+        r["month"]: (r["row_count"], r["version_sum"], r["max_updated_at"])
+        for r in rows
+    }
+
+
+@timed_db
+def get_month_validators(table_id: int, date_from: str, date_to: str) -> dict:
+    """
+    {month_start: (row_count, version_sum, max_updated_at)} for the months
+    between date_from and date_to that have rows. Any insert or update in a
+    month changes its tuple.
+    """
+    query = _MONTH_VALIDATORS_QUERY.format("%s", "%s", "%s")
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, (table_id, date_from, date_to))
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+            return _month_validators(dict(zip(colnames, row)) for row in rows)
+    finally:
+        conn.close()
+
+
+@timed_db
+async def get_month_validators_async(table_id: int, date_from: str, date_to: str) -> dict:
+    query = _MONTH_VALIDATORS_QUERY.format("$1", "$2", "$3")
+    rows = await db_async.fetch(query, table_id, _as_date(date_from), _as_date(date_to))
+    return _month_validators(rows)
+
+
+@timed_db
+def get_row(table_id: int, row_date: str) -> dict | None:
+    query = f"""
+    SELECT {ROW_COLUMNS}
     FROM table_rows
     WHERE table_id = %s AND row_date = %s
     LIMIT 1;
@@ -69,3 +765,86 @@ def get_row(table_id: int, row_date: str) -> dict | None:
             return dict(zip(colnames, row))
     finally:
         conn.close()
+
+
+# Rollup buckets: SQL expression giving each summary month its period.
+ROLLUP_PERIODS = {
+    "month": "s.month",
+    "year": "date_trunc('year', s.month)::date",
+    "total": "$1::date",
+}
+
+
+@timed_db
+async def get_month_totals_rollup_async(
+    month_from: dt_date,
+    month_to: dt_date,
+    period: str = "month",
+    template_id: int | None = None,
+) -> list[dict]:
+    """
+    table_month_totals summed per template and period ("month", "year" or
+    "total") over the months between month_from and month_to.
+    """
+    bucket = ROLLUP_PERIODS[period]
+    where = "s.month BETWEEN $1 AND $2"
+    args = [month_from, month_to]
+    if template_id is not None:
+        where += " AND s.template_id = $3"
+        args.append(template_id)
+    query = f"""
+    WITH bucketed AS (
+      SELECT s.*, {bucket} AS period
+      FROM table_month_totals s
+      WHERE {where}
+    )
+    SELECT
+      template_id,
+      period,
+      count(DISTINCT table_id) AS tables,
+      count(*) AS months,
+      sum(row_count) AS row_count,
+      max(last_row_date) AS last_row_date,
+      sum(prod_fact_t) AS prod_fact_t,
+      sum(prod_plan_month_t) AS prod_plan_month_t,
+      sum(prod_plan_to_date_t) AS prod_plan_to_date_t,
+      sum(ovb_fact_m3) AS ovb_fact_m3,
+      sum(ovb_plan_month_m3) AS ovb_plan_month_m3,
+      sum(ovb_plan_to_date_m3) AS ovb_plan_to_date_m3
+    FROM bucketed
+    GROUP BY template_id, period
+    ORDER BY template_id, period;
+    """
+    return await db_async.fetch(query, *args)
+
+
+@timed_db
+def rebuild_month_totals(table_id: int | None = None) -> int:
+    """
+    Recompute table_month_totals from table_rows for one table or all of
+    them (after creating the table or editing rows by hand). Returns the
+    number of tables refreshed.
+    """
+    query = """
+    SELECT table_id, min(row_date), max(row_date)
+    FROM table_rows
+    WHERE %(table_id)s::int IS NULL OR table_id = %(table_id)s
+    GROUP BY table_id
+    ORDER BY table_id;
+    """
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, {"table_id": table_id})
+            ranges = cur.fetchall()
+            cur.execute(
+                "DELETE FROM table_month_totals WHERE %(table_id)s::int IS NULL OR table_id = %(table_id)s;",
+                {"table_id": table_id},
+            )
+            for tid, first, last in ranges:
+                refresh_month_totals(cur, tid, first, last)
+            conn.commit()
+            return len(ranges)
+    finally:
+        conn.close()
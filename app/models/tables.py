@@ -1,7 +1,11 @@
 import psycopg2
+from app import db_async
 from app.db import get_connection
+from app.models.rows import _as_date
+from app.metrics import timed_db
 
 
+@timed_db
 def list_tables(template_id: int) -> list[dict]:
     query = """
     SELECT id, template_id, name, is_archived, created_at, period_start
@@ -19,6 +23,20 @@ def list_tables(template_id: int) -> list[dict]:
     finally:
         conn.close()
 
+@timed_db
+def list_table_ids(template_id: int) -> list[int]:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id FROM tables WHERE template_id = %s ORDER BY period_start, id;",
+                (template_id,)
+            )
+            return [r[0] for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+@timed_db
 def get_table(table_id: int) -> dict:
     conn = get_connection()
     try:
@@ -37,6 +55,18 @@ def get_table(table_id: int) -> dict:
         conn.close()
 
 
+@timed_db
+async def get_table_async(table_id: int) -> dict:
+    row = await db_async.fetchrow(
+        "SELECT id, template_id, name, is_archived, created_at, period_start FROM tables WHERE id = $1;",
+        table_id,
+    )
+    if row is None:
+        raise ValueError(f"Table not found: {table_id}")
+    return row
+
+
+@timed_db
 def create_month_table(template_id: int, name: str, period_start: str) -> dict:
     query = """
     INSERT INTO tables (template_id, name, period_start)
@@ -58,6 +88,7 @@ def create_month_table(template_id: int, name: str, period_start: str) -> dict:
         conn.close()
 
 
+@timed_db
 def get_table_by_template_and_period(template_id: int, period_start: str) -> dict | None:
     query = """
     SELECT id, template_id, name, is_archived, created_at, period_start
@@ -76,3 +107,14 @@ def get_table_by_template_and_period(template_id: int, period_start: str) -> dic
             return dict(zip(cols, row))
     finally:
         conn.close()
+
+
+@timed_db
+async def get_table_by_template_and_period_async(template_id: int, period_start: str) -> dict | None:
+    query = """
+    SELECT id, template_id, name, is_archived, created_at, period_start
+    FROM tables
+    WHERE template_id = $1 AND period_start = $2
+    LIMIT 1;
+    """
+    return await db_async.fetchrow(query, template_id, _as_date(period_start))
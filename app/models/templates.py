@@ -1,6 +1,9 @@
 import json
+from app import db_async
 from app.db import get_connection
+from app.metrics import timed_db
 
+@timed_db
 def get_template(template_id: int) -> dict:
     conn = get_connection()
     try:
@@ -36,3 +39,37 @@ def get_template(template_id: int) -> dict:
             return res
     finally:
         conn.close()
+
+
+@timed_db
+async def get_template_async(template_id: int) -> dict:
+    query = "SELECT id, name, description, schema_json FROM table_templates WHERE id = $1;"
+    res = await db_async.fetchrow(query, template_id)
+    if res is None:
+        # Same template 1 fallback as get_template
+        if template_id == 1:
+            raise ValueError(f"Template not found: {template_id}")
+        res = await db_async.fetchrow(query, 1)
+        if res is None:
+            raise ValueError(f"Template not found: {template_id}")
+        res["id"] = template_id
+
+    if isinstance(res["schema_json"], str):
+        res["schema_json"] = json.loads(res["schema_json"])
+    return res
+
+
+@timed_db
+def list_templates() -> list[dict]:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, name, description, schema_json FROM table_templates ORDER BY id;")
+            cols = [d[0] for d in cur.description]
+            res = [dict(zip(cols, row)) for row in cur.fetchall()]
+    finally:
+        conn.close()
+    for template in res:
+        if isinstance(template["schema_json"], str):
+            template["schema_json"] = json.loads(template["schema_json"])
+    return res
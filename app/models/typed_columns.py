@@ -0,0 +1,141 @@
+import os
+
+from app import db_async
+from app.db import get_connection
+from app.metrics import timed_db
+from app.utils.cache import TTLCache
+from app.utils.numbers import TYPED_COLUMN_PREFIX, typed_column
+
+# How long a worker trusts its list of typed columns; new columns are picked
+# up after this (columns are only ever added, so a stale list is just slower).
+TYPED_COLUMNS_TTL_SECONDS = float(os.getenv("TYPED_COLUMNS_TTL_SECONDS", "300"))
+
+_typed_keys = TTLCache(maxsize=1, ttl=TYPED_COLUMNS_TTL_SECONDS)
+
+# Whitespace Python's str.strip() removes, for parity with to_number.
+_WS = r"E' \t\n\r\f\x0b'"
+_NUMBER_RE = r"'^[+-]?([0-9]+([.][0-9]*)?|[.][0-9]+)(e[+-]?[0-9]{1,5})?$'"
+# At most 2 exponent digits and under 200 characters: always within float8
+# range, so these cast straight to float8 (the common case).
+_SHORT_NUMBER_RE = r"'^[+-]?([0-9]+([.][0-9]*)?|[.][0-9]+)(e[+-]?[0-9]{1,2})?$'"
+
+
+def _clamp(n: str) -> str:
+    # numeric -> float8 that overflows to +-Infinity and underflows to 0
+    # instead of failing.
+    return (
+        f"CASE WHEN abs({n}) > 1.7976931348623157e308 THEN sign({n}) * 'Infinity'::float8 "
+        f"WHEN abs({n}) < 2.2250738585072014e-308 THEN 0.0 ELSE ({n})::float8 END"
+    )
+
+
+def xl_to_float8_sql(value: str, text: str | None = None) -> str:
+    """
+    SQL expression reading the jsonb expression `value` (`text` reads it as
+    text, e.g. data ->> 'key' for data -> 'key') as float8 with the
+    rules of app.utils.numbers.to_number: numbers and booleans convert,
+    numeric strings are trimmed and parsed, anything else is NULL. Never
+    fails: out-of-range values become +-Infinity or 0 like Python's float().
+    Strings over 1000 characters or with more than 5 exponent digits are
+    NULL.
+    """
+    raw = f"({text})" if text else f"({value} #>> '{{}}')"
+    txt = f"btrim({raw}, {_WS})"
+    return f"""(CASE jsonb_typeof({value})
+      WHEN 'number' THEN CASE
+        WHEN length({raw}) < 300 THEN {raw}::float8
+        ELSE {_clamp(f"({value})::numeric")}
+      END
+      WHEN 'boolean' THEN CASE WHEN ({value})::boolean THEN 1.0 ELSE 0.0 END
+      WHEN 'string' THEN CASE
+        WHEN length({txt}) < 200 AND {txt} ~* {_SHORT_NUMBER_RE} THEN {txt}::float8
+        WHEN length({txt}) > 1000 OR {txt} !~* {_NUMBER_RE} THEN NULL
+        -- numeric can't hold these; the mantissa is too short to bring them back in range
+        WHEN substring({txt} from '[eE]([+-]?[0-9]+)$')::int < -15000 THEN 0.0
+        ELSE {_clamp(f"{txt}::numeric")}
+      END
+    END)"""
+
+
+# IMMUTABLE and never failing, so it can back stored generated columns.
+XL_TO_FLOAT8_SQL = f"""
+CREATE OR REPLACE FUNCTION xl_to_float8(value jsonb) RETURNS double precision
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+  SELECT {xl_to_float8_sql("value")}
+$$;
+"""
+
+_TYPED_KEYS_QUERY = r"""
+SELECT attname
+FROM pg_attribute
+WHERE attrelid = 'table_rows'::regclass
+  AND attgenerated = 's'
+  AND NOT attisdropped
+  AND attname LIKE 'num\_%';
+"""
+
+
+def _keys(names) -> frozenset:
+    return frozenset(name[len(TYPED_COLUMN_PREFIX):] for name in names)
+
+
+@timed_db
+def get_typed_keys() -> frozenset:
+    """Data keys that have a typed column on table_rows (cached per worker)."""
+    keys = _typed_keys.get("keys")
+    if keys is None:
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_TYPED_KEYS_QUERY)
+                keys = _keys(row[0] for row in cur.fetchall())
+        finally:
+            conn.close()
+        _typed_keys.set("keys", keys)
+    return keys
+
+
+@timed_db
+async def get_typed_keys_async() -> frozenset:
+    keys = _typed_keys.get("keys")
+    if keys is None:
+        keys = _keys(row["attname"] for row in await db_async.fetch(_TYPED_KEYS_QUERY))
+        _typed_keys.set("keys", keys)
+    return keys
+
+
+def reset_typed_keys_cache():
+    _typed_keys.clear()
+
+
+@timed_db
+def add_typed_columns(keys) -> list[str]:
+    """
+    Add a stored generated float8 column (num_<key>) to table_rows for every
+    key that doesn't have one yet. Adding columns rewrites table_rows under
+    an exclusive lock, so run this off-peak. Returns the keys added.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_TYPED_KEYS_QUERY)
+            existing = _keys(row[0] for row in cur.fetchall())
+            missing = sorted(set(keys) - existing)
+            # Also brings the function of existing columns up to date.
+            cur.execute(XL_TO_FLOAT8_SQL)
+            if missing:
+                # One ALTER, so the table is rewritten once for all new columns.
+                cur.execute(
+                    "ALTER TABLE table_rows "
+                    + ", ".join(
+                        f"ADD COLUMN IF NOT EXISTS {typed_column(key)} double precision "
+                        f"GENERATED ALWAYS AS (xl_to_float8(data -> '{key}')) STORED"
+                        for key in missing
+                    )
+                    + ";"
+                )
+            conn.commit()
+    finally:
+        conn.close()
+    reset_typed_keys_cache()
+    return missing
@@ -1,6 +1,8 @@
 import json
 from datetime import datetime, timezone
-from app.db import get_connection
+from app import db_async
+from app.db import get_connection, get_pool
+from app.metrics import timed_db
 
 
 def _to_dict(row, colnames):
@@ -15,6 +17,7 @@ def _to_dict(row, colnames):
     return res
 
 
+@timed_db
 def create_user(email: str, name: str, password_hash: str, is_active: bool = True, is_admin: bool = False) -> dict:
     query = """
     INSERT INTO users (email, name, password_hash, is_active, created_at, is_admin)
@@ -36,6 +39,7 @@ def create_user(email: str, name: str, password_hash: str, is_active: bool = Tru
         conn.close()
 
 
+@timed_db
 def get_user_by_email(email: str) -> dict | None:
     query = "SELECT * FROM users WHERE email = %s LIMIT 1;"
     conn = get_connection()
@@ -51,6 +55,29 @@ def get_user_by_email(email: str) -> dict | None:
         conn.close()
 
 
+@timed_db
+def get_user_for_login(email: str) -> dict | None:
+    """
+    get_user_by_email on a pooled connection of its own, handed back before
+    returning even inside a request session: callers go on to check the
+    password, which can take a while, and must not hold a connection meanwhile.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM users WHERE email = %s LIMIT 1;", (email,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            colnames = [desc[0] for desc in cur.description]
+            return _to_dict(row, colnames)
+    finally:
+        # putconn rolls back the read-only transaction.
+        pool.putconn(conn)
+
+
+@timed_db
 def get_user_by_id(user_id: int) -> dict | None:
     query = "SELECT * FROM users WHERE id = %s LIMIT 1;"
     conn = get_connection()
@@ -64,3 +91,23 @@ def get_user_by_id(user_id: int) -> dict | None:
             return _to_dict(row, colnames)
     finally:
         conn.close()
+
+
+@timed_db
+async def get_user_by_id_async(user_id: int) -> dict | None:
+    row = await db_async.fetchrow("SELECT * FROM users WHERE id = $1 LIMIT 1;", user_id)
+    if row is None:
+        return None
+    return _to_dict(tuple(row.values()), list(row.keys()))
+
+
+@timed_db
+def update_user_password_hash(user_id: int, password_hash: str) -> None:
+    query = "UPDATE users SET password_hash = %s WHERE id = %s;"
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, (password_hash, user_id))
+            conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,34 @@
+"""
+JSON encoding with orjson.
+
+orjson writes dates, datetimes, UUIDs and NumPy values natively, so payloads
+are encoded straight from the row dicts, without jsonable_encoder's deep
+copy. The output is the same compact UTF-8 JSON the stdlib encoder gives,
+except that NaN and infinities become null instead of failing the response.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson. Routes returning one directly skip
+    FastAPI's jsonable_encoder pass over the payload as well.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,33 +1,39 @@
 import os
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from fastapi import HTTPException, status
 from jose import JWTError, jwt
-import bcrypt
-
-from app.models.users import create_user, get_user_by_email, get_user_by_id
+from starlette.concurrency import run_in_threadpool
+
+from app.models.users import (
+    create_user,
+    get_user_by_email,
+    get_user_by_id,
+    get_user_by_id_async,
+    get_user_for_login,
+    update_user_password_hash,
+)
+from app.services.password_service import (
+    PasswordHasherBusy,
+    hash_password_async,
+    needs_rehash,
+    record_login,
+    verify_password,
+    verify_password_async,
+)
+from app.utils.cache import TTLCache
 
 SECRET_KEY = os.getenv("AUTH_SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
 
-
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
-
-
-def verify_password(plain_password: str, password_hash: str) -> bool:
-    try:
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"),
-            password_hash.encode("utf-8"),
-        )
-    except ValueError:
-        # Bad hash format
-        return False
+# Verified token -> active user. Bounds how long a deactivated user keeps access
+# on workers that didn't see the invalidation.
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", "10000"))
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
 
 
 def authenticate_user(login: str, password: str) -> dict | None:
@@ -39,6 +45,42 @@ def authenticate_user(login: str, password: str) -> dict | None:
     return user
 
 
+async def authenticate_user_async(login: str, password: str) -> dict | None:
+    """
+    Same as authenticate_user, but bcrypt runs on the bounded password
+    executor (raises PasswordHasherBusy when it is saturated) and hashes made
+    with a different cost than BCRYPT_ROUNDS are upgraded on success. The
+    user is read on a connection released before the check, so logins
+    waiting for bcrypt don't hold database connections.
+    """
+    started = time.perf_counter()
+    ok = False
+    rehashed = False
+    try:
+        user = await run_in_threadpool(get_user_for_login, login)
+        if not user or not user.get("is_active"):
+            return None
+        if not await verify_password_async(password, user["password_hash"]):
+            return None
+        ok = True
+        if needs_rehash(user["password_hash"]):
+            rehashed = await _rehash(user, password)
+        return user
+    finally:
+        record_login(time.perf_counter() - started, ok, rehashed)
+
+
+async def _rehash(user: dict, password: str) -> bool:
+    try:
+        new_hash = await hash_password_async(password)
+    except PasswordHasherBusy:
+        # Not worth failing a good login over; try again next time.
+        return False
+    await run_in_threadpool(update_user_password_hash, user["id"], new_hash)
+    user["password_hash"] = new_hash
+    return True
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (
@@ -68,24 +110,37 @@ def sanitize_user(user: dict) -> dict:
     return clean
 
 
-def register_user(email: str, name: str, password: str, is_admin: bool = False) -> dict:
-    existing = get_user_by_email(email)
+async def register_user_async(email: str, name: str, password: str, is_admin: bool = False) -> dict:
+    """Hashes on the password executor like logins (raises PasswordHasherBusy)."""
+    existing = await run_in_threadpool(get_user_for_login, email)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already exists",
         )
-    new_user = create_user(
+    password_hash = await hash_password_async(password)
+    return await run_in_threadpool(
+        create_user,
         email=email,
         name=name,
-        password_hash=hash_password(password),
+        password_hash=password_hash,
         is_admin=is_admin,
     )
-    return new_user
 
 
-def get_user_by_token(token: str) -> dict:
-    payload = decode_token(token)
+def invalidate_user_tokens(user_id: int | None = None) -> int:
+    """
+    Drop cached token lookups for a user (for everyone when user_id is None).
+    Call after a user is changed or deactivated.
+    """
+    if user_id is None:
+        count = len(_token_cache)
+        _token_cache.clear()
+        return count
+    return _token_cache.discard_where(lambda _, user: user["id"] == user_id)
+
+
+def _token_user_id(payload: dict) -> int:
     sub = payload.get("sub")
     if sub is None:
         raise HTTPException(
@@ -93,11 +148,43 @@ def get_user_by_token(token: str) -> dict:
             detail="Invalid token payload",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = get_user_by_id(int(sub))
+    return int(sub)
+
+
+def _remember_user(token: str, payload: dict, user: dict | None) -> dict:
     if not user or not user.get("is_active"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User inactive or not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    ttl = TOKEN_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    if ttl > 0:
+        _token_cache.set(token, user, ttl=ttl)
     return user
+
+
+def get_user_by_token(token: str) -> dict:
+    # Cache hit: signature, expiry and the user record were already checked.
+    # The returned dict is shared, so callers must not mutate it.
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload = decode_token(token)
+    user = get_user_by_id(_token_user_id(payload))
+    return _remember_user(token, payload, user)
+
+
+async def get_user_by_token_async(token: str) -> dict:
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload = decode_token(token)
+    user = await get_user_by_id_async(_token_user_id(payload))
+    return _remember_user(token, payload, user)
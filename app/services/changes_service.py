@@ -0,0 +1,75 @@
+import calendar
+import os
+from datetime import datetime, timedelta, timezone
+
+from app.models.rows import get_changed_rows_async, get_db_time_async
+from app.services.row_service import list_rows_async
+
+CHANGES_MAX_ROWS = int(os.getenv("CHANGES_MAX_ROWS", "2000"))
+# updated_at is the writing transaction's start time but becomes visible at
+# commit, so every poll looks this far behind the cursor again. Clients skip
+# rows whose version they already have.
+CHANGES_OVERLAP_SECONDS = float(os.getenv("CHANGES_OVERLAP_SECONDS", "30"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(ts: datetime) -> str:
+    return str((ts - _EPOCH) // timedelta(microseconds=1))
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        return _EPOCH + timedelta(microseconds=int(cursor))
+    except (ValueError, OverflowError):
+        raise ValueError("Invalid cursor")
+
+
+async def get_changes_async(table_id: int, since: str | None) -> dict:
+    """
+    Rows of a table changed after the `since` cursor, plus the later rows of
+    the same month whose to-date values changed with them, and the cursor to
+    send next time.
+
+    Without `since` only a starting cursor is returned; take it before
+    loading the view. "reload" is true when more than CHANGES_MAX_ROWS rows
+    changed: load the view again and continue from the returned cursor.
+    """
+    if since is None:
+        now = await get_db_time_async()
+        return {"cursor": encode_cursor(now), "reload": False, "changed": [], "rows": []}
+
+    since_ts = decode_cursor(since)
+    # The next cursor is the database clock before the lookup, so quiet
+    # tables stop returning old rows once the overlap has passed.
+    now = await get_db_time_async()
+    changed = await get_changed_rows_async(
+        table_id,
+        since_ts - timedelta(seconds=CHANGES_OVERLAP_SECONDS),
+        CHANGES_MAX_ROWS + 1,
+    )
+    if len(changed) > CHANGES_MAX_ROWS:
+        return {"cursor": encode_cursor(now), "reload": True, "changed": [], "rows": []}
+
+    # Running sums restart every month: recompute from the first change of
+    # each month to its end.
+    first_change = {}
+    for change in changed:
+        month = change["row_date"].replace(day=1)
+        first_change[month] = min(first_change.get(month, change["row_date"]), change["row_date"])
+    rows = []
+    for month in sorted(first_change):
+        month_end = month.replace(day=calendar.monthrange(month.year, month.month)[1])
+        rows.extend(
+            await list_rows_async(table_id, first_change[month].isoformat(), month_end.isoformat())
+        )
+
+    return {
+        "cursor": encode_cursor(now),
+        "reload": False,
+        "changed": [
+            {"row_date": c["row_date"].isoformat(), "version": c["version"]}
+            for c in sorted(changed, key=lambda c: c["row_date"])
+        ],
+        "rows": rows,
+    }
@@ -0,0 +1,132 @@
+import csv
+import io
+import os
+from datetime import date as dt_date
+from itertools import islice
+
+from app.models.rows import iter_rows
+from app.responses import dumps
+from app.services.compute_engine import iter_running_fields
+from app.services.formulas import BUILTIN_FORMULAS
+from app.utils.xlsx import iter_xlsx
+
+# Rows fetched from the server-side cursor (and computed) per round trip.
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+# Rows encoded into one chunk of the response body.
+EXPORT_BATCH_ROWS = 500
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _batches(rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, EXPORT_BATCH_ROWS))
+        if not batch:
+            return
+        yield batch
+
+
+def encode_ndjson(rows):
+    for batch in _batches(rows):
+        yield b"".join(dumps(row) + b"\n" for row in batch)
+
+
+def encode_json(rows):
+    """One JSON array, encoded a batch of rows at a time."""
+    sep = b"["
+    for batch in _batches(rows):
+        yield sep + b",".join(dumps(row) for row in batch)
+        sep = b","
+    yield b"[]" if sep == b"[" else b"]"
+
+
+def export_columns(schema_json: dict, formulas: dict = BUILTIN_FORMULAS) -> list[tuple[str, str]]:
+    """
+    (key, title) pairs for spreadsheet exports: the template's columns in
+    schema order, then any computed field the template doesn't list.
+    """
+    columns = []
+    for col in schema_json.get("columns", []):
+        if "key" in col:
+            columns.append((col["key"], col.get("title") or col.get("label") or col["key"]))
+    known = {key for key, _ in columns}
+    columns.extend((key, key) for key in formulas["outputs"] if key not in known)
+    return columns
+
+
+def _cells(row: dict, keys: list[str]) -> list:
+    data = row.get("data") or {}
+    return [data[key] if key in data else row.get(key) for key in keys]
+
+
+def encode_csv(rows, columns: list[tuple[str, str]]):
+    # The BOM makes Excel open the file as UTF-8.
+    keys = [key for key, _ in columns]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow([title for _, title in columns])
+    for batch in _batches(rows):
+        writer.writerows(_cells(row, keys) for row in batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def encode_xlsx(rows, columns: list[tuple[str, str]], sheet_name: str = "Sheet1"):
+    keys = [key for key, _ in columns]
+    batches = (
+        [_xlsx_cells(row, keys) for row in batch]
+        for batch in _batches(rows)
+    )
+    return iter_xlsx([title for _, title in columns], batches, sheet_name=sheet_name)
+
+
+def _xlsx_cells(row: dict, keys: list[str]) -> list:
+    cells = _cells(row, keys)
+    # row_date is an ISO string after computation; Excel gets a real date.
+    return [
+        dt_date.fromisoformat(v) if key == "row_date" and isinstance(v, str) else v
+        for key, v in zip(keys, cells)
+    ]
+
+
+def export_rows(
+    table_ids: list[int],
+    from_date: str,
+    to_date: str,
+    fmt: str = "ndjson",
+    schema_json: dict | None = None,
+    sheet_name: str = "Sheet1",
+    formulas: dict = BUILTIN_FORMULAS,
+):
+    """
+    Encoded body chunks with the rows of table_ids between from_date and
+    to_date, computed with `formulas`, ordered by (table_id, row_date).
+    csv and xlsx use the columns of schema_json (see export_columns). Dates
+    and the format are checked here, before anything is streamed; rows are
+    only read from the database while the body is consumed.
+    """
+    from_dt = dt_date.fromisoformat(from_date)
+    to_dt = dt_date.fromisoformat(to_date)
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    # Running sums need every row from the start of the first month.
+    rows = iter_rows(
+        table_ids, from_dt.replace(day=1).isoformat(), to_date, EXPORT_FETCH_SIZE, formulas["sources"]
+    )
+    computed = iter_running_fields(rows, from_dt, to_dt, EXPORT_FETCH_SIZE, formulas, in_place=True)
+    if fmt == "csv":
+        return encode_csv(computed, export_columns(schema_json or {}, formulas))
+    if fmt == "xlsx":
+        return encode_xlsx(computed, export_columns(schema_json or {}, formulas), sheet_name=sheet_name)
+    return encode_ndjson(computed) if fmt == "ndjson" else encode_json(computed)
@@ -0,0 +1,161 @@
+"""
+Derived columns declared in a template's schema_json.
+
+A column with a "formula" is computed for every row from other columns:
+
+    {"key": "prod_fact_to_date_t", "formula": {"op": "running_sum", "of": "prod_fact_day_t"}}
+
+Operations:
+  running_sum   "of": key          sum from the 1st of the month to the row
+  plan_per_day  "of": key          the month plan (first value present in the
+                                   month, read from stored data) / days in month
+  difference    "of": [a, b]       a - b
+  ratio         "of": [a, b]       a / b, times "scale" when given; null when b is 0
+
+Operands name formula columns (computed first) or stored data keys (parsed
+like to_number, missing values count as 0); plan_per_day always reads
+stored data, so a plan column can carry the running plan under its own key.
+compile_formulas turns the declarations into a plan for compute_engine:
+steps in dependency order, outputs in schema order and the data keys read.
+Templates without formulas get BUILTIN_FORMULAS, the production/overburden
+columns of the coal template.
+"""
+OPS = {"running_sum": 1, "plan_per_day": 1, "difference": 2, "ratio": 2}
+
+
+class FormulaError(ValueError):
+    """Invalid formula declarations in a template's schema_json."""
+
+
+def _metric(fact: str, plan: str, fact_td: str, plan_day: str, dev: str, pct: str) -> list:
+    # In the order add_computed_fields writes them.
+    return [
+        {"key": fact_td, "formula": {"op": "running_sum", "of": fact}},
+        {"key": plan, "formula": {"op": "running_sum", "of": plan_day}},
+        {"key": plan_day, "formula": {"op": "plan_per_day", "of": plan}},
+        {"key": dev, "formula": {"op": "difference", "of": [fact_td, plan]}},
+        {"key": pct, "formula": {"op": "ratio", "of": [fact_td, plan], "scale": 100}},
+    ]
+
+
+BUILTIN_COLUMNS = _metric(
+    "prod_fact_day_t",
+    "prod_plan_to_date_t",
+    "prod_fact_to_date_t",
+    "prod_plan_day_t",
+    "prod_dev_to_date_t",
+    "prod_pct_to_date",
+) + _metric(
+    "ovb_fact_day_m3",
+    "ovb_plan_to_date_m3",
+    "ovb_fact_to_date_m3",
+    "ovb_plan_day_m3",
+    "ovb_dev_to_date_m3",
+    "ovb_pct_to_date",
+)
+
+
+def _operands(key: str, formula) -> tuple:
+    if not isinstance(formula, dict) or formula.get("op") not in OPS:
+        raise FormulaError(f"Formula of {key}: op must be one of {', '.join(OPS)}")
+    of = formula.get("of")
+    operands = [of] if isinstance(of, str) else of
+    if (
+        not isinstance(operands, list)
+        or len(operands) != OPS[formula["op"]]
+        or not all(isinstance(o, str) and o for o in operands)
+    ):
+        raise FormulaError(f"Formula of {key}: {formula['op']} takes {OPS[formula['op']]} key(s) in \"of\"")
+    return tuple(operands)
+
+
+def _scale(key: str, formula: dict) -> float | None:
+    scale = formula.get("scale")
+    if scale is None:
+        return None
+    if formula["op"] != "ratio" or isinstance(scale, bool) or not isinstance(scale, (int, float)):
+        raise FormulaError(f"Formula of {key}: only ratio takes a numeric scale")
+    return float(scale)
+
+
+def compile_formulas(columns: list) -> dict:
+    """
+    Evaluation plan for the formula columns of a schema_json column list:
+      steps    (key, op, ((operand, computed), ...), scale) in dependency order
+      outputs  computed keys in column order (the order they are written)
+      writes   the steps in that order
+      sources  stored data keys read as numbers
+    Raises FormulaError for unknown operations, bad operands, duplicate keys
+    and cycles.
+    """
+    formulas = {}
+    for col in columns:
+        if "formula" not in col:
+            continue
+        key = col.get("key")
+        if not isinstance(key, str) or not key:
+            raise FormulaError("Formula columns need a key")
+        if key in formulas:
+            raise FormulaError(f"Formula of {key} is declared twice")
+        formulas[key] = col["formula"]
+
+    declared = {}
+    for key, formula in formulas.items():
+        op = formula.get("op") if isinstance(formula, dict) else None
+        operands = _operands(key, formula)
+        declared[key] = (
+            op,
+            # plan_per_day reads what was typed in, even under a formula key.
+            tuple((o, op != "plan_per_day" and o in formulas) for o in operands),
+            _scale(key, formula),
+        )
+
+    steps = []
+    done = set()
+    visiting = []
+
+    def visit(key):
+        if key in done:
+            return
+        if key in visiting:
+            raise FormulaError(f"Formula cycle: {' -> '.join(visiting[visiting.index(key):] + [key])}")
+        visiting.append(key)
+        op, operands, scale = declared[key]
+        for operand, computed in operands:
+            if computed:
+                visit(operand)
+        visiting.pop()
+        done.add(key)
+        steps.append((key, op, operands, scale))
+
+    for key in declared:
+        visit(key)
+    by_key = {step[0]: step for step in steps}
+    return {
+        "steps": tuple(steps),
+        "outputs": tuple(declared),
+        "writes": tuple(by_key[key] for key in declared),
+        "sources": tuple(sorted({o for _, _, operands, _ in steps for o, computed in operands if not computed})),
+    }
+
+
+def _by_key(compiled: dict) -> dict:
+    return {step[0]: step[1:] for step in compiled["steps"]}
+
+
+BUILTIN_FORMULAS = {**compile_formulas(BUILTIN_COLUMNS), "builtin": True}
+
+
+def template_formulas(schema_json: dict) -> dict:
+    """
+    Compiled formulas of a template, BUILTIN_FORMULAS when it declares none
+    or the same ones. "builtin" tells whether they are the built-in ones,
+    which ROW_TOTALS_MODE=sql and the monthly summaries implement in SQL.
+    """
+    columns = [c for c in schema_json.get("columns", []) if isinstance(c, dict) and "formula" in c]
+    if not columns:
+        return BUILTIN_FORMULAS
+    compiled = compile_formulas(columns)
+    if _by_key(compiled) == _by_key(BUILTIN_FORMULAS):
+        return BUILTIN_FORMULAS
+    return {**compiled, "builtin": False}
@@ -0,0 +1,179 @@
+import csv
+import io
+import math
+import re
+import zipfile
+from datetime import date as dt_date, datetime
+
+from app.models.rows import copy_merge_rows
+from app.services.month_cache import invalidate_months
+from app.services.template_service import get_compiled_template_for_table
+
+# Per-line errors returned in the summary; the rest are only counted.
+IMPORT_MAX_ERRORS = 1000
+
+_DECIMAL_COMMA = re.compile(r"^[+-]?\d+,\d+$")
+_INTEGER = re.compile(r"^[+-]?\d+$")
+
+
+def _normalize(header) -> str:
+    return str(header or "").strip().casefold()
+
+
+def _map_columns(schema_json: dict, editable: frozenset, header: list) -> tuple:
+    """
+    Header cells -> keys via column key or title. Returns (date_index,
+    {index: key} for editable columns, [ignored header cells]).
+    """
+    names = {}
+    for col in schema_json.get("columns", []):
+        if "key" not in col:
+            continue
+        for name in (col["key"], col.get("title"), col.get("label")):
+            if name:
+                names.setdefault(_normalize(name), col["key"])
+    names.setdefault("row_date", "row_date")
+
+    date_index = None
+    columns = {}
+    ignored = []
+    for i, cell in enumerate(header):
+        key = names.get(_normalize(cell))
+        if key == "row_date" and date_index is None:
+            date_index = i
+        elif key in editable:
+            columns[i] = key
+        elif _normalize(cell):
+            ignored.append(str(cell))
+    if date_index is None:
+        raise ValueError("No date column (row_date) in the header")
+    return date_index, columns, ignored
+
+
+def _parse_date(value) -> dt_date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, dt_date):
+        return value
+    text = str(value or "").strip()
+    if "." in text:
+        return datetime.strptime(text, "%d.%m.%Y").date()
+    return dt_date.fromisoformat(text)
+
+
+def _cell_value(value, numeric: bool):
+    """
+    Spreadsheet cell -> JSON value; None means "leave the stored value".
+    Text is only parsed as a number in numeric columns; other columns keep
+    it as typed (stripped), like saves through the API.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) else str(value)
+    if isinstance(value, (datetime, dt_date)):
+        return value.isoformat()
+    text = str(value).strip()
+    if text == "":
+        return None
+    if not numeric:
+        return text
+    if _INTEGER.match(text):
+        return int(text)
+    if _DECIMAL_COMMA.match(text):
+        text = text.replace(",", ".")
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return number if math.isfinite(number) else text
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    sample = text.read(64 * 1024)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def _xlsx_rows(file):
+    # openpyxl is only needed for xlsx uploads.
+    import openpyxl
+
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError):
+        raise ValueError("Not a valid xlsx file")
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def import_rows(table_id: int, file, fmt: str, user_id: int) -> dict:
+    """
+    Import a CSV or XLSX file into a table. The first row is the header,
+    matched against the template's column keys/titles; only editable columns
+    are kept (see filter_editable_keys). Lines are validated and streamed into
+    Postgres with COPY, then merged into table_rows in one statement.
+    Empty cells leave stored values alone. Lines with a bad date, or with a
+    cell that isn't a number in a numeric column ("type": "number" or read by
+    a formula), are skipped and reported.
+    """
+    compiled = get_compiled_template_for_table(table_id)
+    schema = compiled["template"]["schema_json"]
+    if fmt == "csv":
+        lines = _csv_rows(file)
+    elif fmt == "xlsx":
+        lines = _xlsx_rows(file)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+    header = next(lines, None)
+    if header is None:
+        raise ValueError("The file is empty")
+    date_index, columns, ignored = _map_columns(schema, compiled["editable_keys"], list(header))
+    numeric = compiled["numeric_keys"] | set((compiled["formulas"] or {}).get("sources", ()))
+
+    summary = {"lines": 0, "skipped": 0, "errors": [], "ignored_columns": ignored}
+    months = set()
+
+    def error(line: int, message: str):
+        summary["skipped"] += 1
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": message})
+
+    def parsed():
+        for line, cells in enumerate(lines, start=2):
+            if not any(c is not None and str(c).strip() for c in cells):
+                continue
+            summary["lines"] += 1
+            try:
+                row_date = _parse_date(cells[date_index] if date_index < len(cells) else None)
+            except ValueError:
+                error(line, "Invalid date, use YYYY-MM-DD or DD.MM.YYYY")
+                continue
+            data = {}
+            bad = []
+            for i, key in columns.items():
+                value = _cell_value(cells[i], key in numeric) if i < len(cells) else None
+                if value is None:
+                    continue
+                if key in numeric and isinstance(value, str):
+                    bad.append(str(header[i]))
+                data[key] = value
+            if bad:
+                error(line, f"Not a number in {', '.join(bad)}")
+                continue
+            months.add(row_date.replace(day=1))
+            yield line, row_date, data
+
+    summary.update(copy_merge_rows(table_id, parsed(), user_id))
+    invalidate_months(table_id, months)
+    return summary
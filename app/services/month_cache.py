@@ -0,0 +1,214 @@
+"""
+In-process cache of computed month views, keyed by (table_id, month_start).
+
+An entry holds one month of raw rows, the unrounded running state from
+compute_engine and the rendered rows, computed with the template's formulas
+at the time (entries computed with other formulas are refetched). Reads compare every month of the window
+against a per-month validator (row count, version sum, last update) fetched
+in one grouped query, so only months changed elsewhere (other workers,
+rolled back transactions, direct SQL) are refetched. Saving a row recomputes
+the running sums from that row to the end of its month only.
+
+Entries are replaced, never modified, so a reader can keep slicing an entry
+while a save swaps in a new one. Rendered rows are shared between requests
+and must not be mutated by callers.
+"""
+import bisect
+import calendar
+import os
+from datetime import date as dt_date
+
+import numpy as np
+
+from app.models.rows import (
+    get_rows,
+    get_rows_async,
+    get_month_validators,
+    get_month_validators_async,
+)
+from app.services.compute_engine import carry_at, render, running_totals
+from app.utils.cache import TTLCache
+
+# Number of (table, month) entries kept; 0 disables the cache.
+MONTH_VIEW_CACHE_SIZE = int(os.getenv("MONTH_VIEW_CACHE_SIZE", "256"))
+MONTH_VIEW_CACHE_TTL_SECONDS = float(os.getenv("MONTH_VIEW_CACHE_TTL_SECONDS", "600"))
+
+_months = TTLCache(maxsize=max(MONTH_VIEW_CACHE_SIZE, 1), ttl=MONTH_VIEW_CACHE_TTL_SECONDS)
+
+
+def _to_date(value) -> dt_date:
+    if isinstance(value, dt_date):
+        return value
+    return dt_date.fromisoformat(str(value))
+
+
+def _month_end(month: dt_date) -> dt_date:
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def _months_between(first: dt_date, last: dt_date) -> list:
+    months = []
+    month = first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = dt_date.fromordinal(_month_end(month).toordinal() + 1)
+    return months
+
+
+def _validator(rows: list) -> tuple:
+    if not rows:
+        return (0, 0, None)
+    return (len(rows), sum(r["version"] for r in rows), max(r["updated_at"] for r in rows))
+
+
+def _entry(rows: list, validator: tuple, formulas: dict) -> dict:
+    state = running_totals(rows, formulas=formulas)
+    return {
+        "rows": rows,
+        "state": state,
+        "rendered": render(rows, state, 0, len(rows)),
+        "validator": validator,
+    }
+
+
+def _with_suffix(entry: dict, rows: list, i: int, validator: tuple) -> dict:
+    """Entry for `rows`, which equal entry["rows"] before index i."""
+    old = entry["state"]
+    # The state after row i-1 is all the suffix needs from the rows before it.
+    suffix = running_totals(rows[i:], carry_at(old, i - 1) if i else None, old["formulas"])
+    state = {
+        "dates": old["dates"][:i] + suffix["dates"],
+        "datas": old["datas"][:i] + suffix["datas"],
+        "values": {k: np.concatenate((old["values"][k][:i], v)) for k, v in suffix["values"].items()},
+        "flags": {k: np.concatenate((old["flags"][k][:i], v)) for k, v in suffix["flags"].items()},
+        "formulas": old["formulas"],
+    }
+    return {
+        "rows": rows,
+        "state": state,
+        "rendered": entry["rendered"][:i] + render(rows, state, i, len(rows)),
+        "validator": validator,
+    }
+
+
+def _plan(from_date: str, to_date: str) -> tuple | None:
+    from_dt = dt_date.fromisoformat(from_date)
+    to_dt = dt_date.fromisoformat(to_date)
+    months = _months_between(from_dt, to_dt)
+    if not months or len(months) > MONTH_VIEW_CACHE_SIZE:
+        return None
+    return from_dt, to_dt, months
+
+
+def _lookup(table_id: int, months: list, validators: dict, formulas: dict) -> tuple:
+    entries = {}
+    stale = []
+    for month in months:
+        entry = _months.get((table_id, month))
+        if (
+            entry is not None
+            and entry["validator"] == validators.get(month, (0, 0, None))
+            and entry["state"]["formulas"] == formulas
+        ):
+            entries[month] = entry
+        else:
+            stale.append(month)
+    return entries, stale
+
+
+def _store(table_id: int, months: list, rows: list, entries: dict, formulas: dict):
+    by_month = {month: [] for month in months}
+    for row in rows:
+        bucket = by_month.get(_to_date(row["row_date"]).replace(day=1))
+        if bucket is not None:
+            bucket.append(row)
+    for month, month_rows in by_month.items():
+        validator = _validator(month_rows)
+        entry = _entry(month_rows, validator, formulas)
+        # A month written between the two queries is cached with the validator
+        # of the rows actually read, so the next read refetches it.
+        _months.set((table_id, month), entry)
+        entries[month] = entry
+
+
+def _window(entries: dict, months: list, from_dt: dt_date, to_dt: dt_date) -> list:
+    out = []
+    for month in months:
+        entry = entries[month]
+        dates = entry["state"]["dates"]
+        lo = bisect.bisect_left(dates, from_dt)
+        hi = bisect.bisect_right(dates, to_dt)
+        out.extend(entry["rendered"][lo:hi])
+    return out
+
+
+def cached_rows(table_id: int, from_date: str, to_date: str, formulas: dict) -> list | None:
+    """
+    Rows for [from_date, to_date] computed with `formulas` (the table's
+    template_formulas) served from cached months, or None when the cache is
+    disabled or the window spans more months than it holds.
+    """
+    plan = _plan(from_date, to_date) if MONTH_VIEW_CACHE_SIZE > 0 else None
+    if plan is None:
+        return None
+    from_dt, to_dt, months = plan
+    validators = get_month_validators(table_id, months[0].isoformat(), _month_end(months[-1]).isoformat())
+    entries, stale = _lookup(table_id, months, validators, formulas)
+    if stale:
+        rows = get_rows(table_id, stale[0].isoformat(), _month_end(stale[-1]).isoformat(), formulas["sources"])
+        _store(table_id, stale, rows, entries, formulas)
+    return _window(entries, months, from_dt, to_dt)
+
+
+async def cached_rows_async(table_id: int, from_date: str, to_date: str, formulas: dict) -> list | None:
+    plan = _plan(from_date, to_date) if MONTH_VIEW_CACHE_SIZE > 0 else None
+    if plan is None:
+        return None
+    from_dt, to_dt, months = plan
+    validators = await get_month_validators_async(
+        table_id, months[0].isoformat(), _month_end(months[-1]).isoformat()
+    )
+    entries, stale = _lookup(table_id, months, validators, formulas)
+    if stale:
+        rows = await get_rows_async(
+            table_id, stale[0].isoformat(), _month_end(stale[-1]).isoformat(), formulas["sources"]
+        )
+        _store(table_id, stale, rows, entries, formulas)
+    return _window(entries, months, from_dt, to_dt)
+
+
+def apply_saved_row(table_id: int, row: dict):
+    """
+    Fold a row just written to table_rows into its cached month, recomputing
+    running sums from that row on. The expected validator is updated too; if
+    the write is later rolled back or other rows changed meanwhile, the next
+    read sees a different validator and refetches the month.
+    """
+    row_dt = _to_date(row["row_date"])
+    key = (table_id, row_dt.replace(day=1))
+    entry = _months.get(key)
+    if entry is None:
+        return
+    rows = entry["rows"]
+    count, version_sum, last_update = entry["validator"]
+    i = bisect.bisect_left(entry["state"]["dates"], row_dt)
+    if i < len(rows) and _to_date(rows[i]["row_date"]) == row_dt:
+        version_sum += row["version"] - rows[i]["version"]
+        rows = rows[:i] + [row] + rows[i + 1:]
+    else:
+        count += 1
+        version_sum += row["version"]
+        rows = rows[:i] + [row] + rows[i:]
+    if last_update is None or row["updated_at"] > last_update:
+        last_update = row["updated_at"]
+    _months.set(key, _with_suffix(entry, rows, i, (count, version_sum, last_update)))
+
+
+def invalidate_months(table_id: int, dates) -> int:
+    """Drop the cached months containing any of `dates`."""
+    months = {_to_date(d).replace(day=1) for d in dates}
+    return sum(_months.pop((table_id, month)) is not None for month in months)
+
+
+def month_cache_stats() -> dict:
+    return _months.stats()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from app.metrics import PASSWORD_HASH
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Jobs allowed to be running or queued at once; anything above is rejected.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_stats_lock = threading.Lock()
+_stats = {
+    "jobs": 0,
+    "rejected": 0,
+    "pending": 0,
+    "job_seconds_total": 0.0,
+    "job_seconds_max": 0.0,
+    "logins": 0,
+    "login_failures": 0,
+    "login_seconds_total": 0.0,
+    "login_seconds_max": 0.0,
+    "rehashes": 0,
+}
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    with PASSWORD_HASH.labels("hash").time():
+        hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
+    return hashed.decode("utf-8")
+
+
+def verify_password(plain_password: str, password_hash: str) -> bool:
+    try:
+        with PASSWORD_HASH.labels("verify").time():
+            return bcrypt.checkpw(
+                plain_password.encode("utf-8"),
+                password_hash.encode("utf-8"),
+            )
+    except ValueError:
+        # Bad hash format
+        return False
+
+
+def hash_rounds(password_hash: str) -> int | None:
+    # $2b$12$<salt+hash>
+    parts = password_hash.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            _stats["jobs"] += 1
+            _stats["job_seconds_total"] += elapsed
+            _stats["job_seconds_max"] = max(_stats["job_seconds_max"], elapsed)
+
+
+def _release(_future):
+    _slots.release()
+    with _stats_lock:
+        _stats["pending"] -= 1
+
+
+async def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise PasswordHasherBusy("Too many password checks in progress")
+    with _stats_lock:
+        _stats["pending"] += 1
+    future = _executor.submit(_timed, fn, *args)
+    # Release from the future so a cancelled request doesn't leak its slot.
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _submit(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    return await _submit(verify_password, plain_password, password_hash)
+
+
+def record_login(elapsed: float, ok: bool, rehashed: bool = False):
+    with _stats_lock:
+        _stats["logins"] += 1
+        if not ok:
+            _stats["login_failures"] += 1
+        if rehashed:
+            _stats["rehashes"] += 1
+        _stats["login_seconds_total"] += elapsed
+        _stats["login_seconds_max"] = max(_stats["login_seconds_max"], elapsed)
+
+
+def password_stats() -> dict:
+    with _stats_lock:
+        res = dict(_stats)
+    res.update(
+        {
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "workers": PASSWORD_HASH_WORKERS,
+            "max_pending": PASSWORD_HASH_MAX_PENDING,
+        }
+    )
+    return res
+
+
+def shutdown_password_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
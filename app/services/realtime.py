@@ -0,0 +1,231 @@
+"""
+Realtime row updates for WebSocket and SSE clients.
+
+Model functions NOTIFY on ROW_EVENTS_CHANNEL when rows change (delivered when
+the writing transaction commits). Each worker keeps one asyncpg connection
+LISTENing on it and pushes the changed rows, with recomputed derived fields,
+to every client subscribed to that table. Events for a table that arrive
+within REALTIME_BATCH_SECONDS are coalesced and computed once for all of its
+subscribers, so clients no longer need to poll /tables/{id}/view.
+
+Messages are JSON objects:
+  {"type": "rows", "table_id": 1, "from": "...", "to": "...", "rows": [...]}
+      rows from the first changed day to the end of its month (running sums
+      of later days change too), same shape as the view's rows;
+  {"type": "resync", "table_id": 1}
+      events may have been missed (listener reconnected, client too slow);
+      reload the view.
+"""
+import asyncio
+import calendar
+import contextvars
+import json
+import logging
+import os
+from datetime import date as dt_date
+
+import asyncpg
+from starlette.websockets import WebSocket
+
+from app.models.rows import ROW_EVENTS_CHANNEL
+from app.responses import dumps
+from app.services.row_service import list_rows_async
+
+REALTIME_ENABLED = os.getenv("REALTIME_ENABLED", "1") == "1"
+REALTIME_BATCH_SECONDS = float(os.getenv("REALTIME_BATCH_SECONDS", "0.05"))
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+REALTIME_RECONNECT_SECONDS = float(os.getenv("REALTIME_RECONNECT_SECONDS", "5"))
+REALTIME_KEEPALIVE_SECONDS = float(os.getenv("REALTIME_KEEPALIVE_SECONDS", "15"))
+
+logger = logging.getLogger(__name__)
+
+
+def _month_end(d: dt_date) -> dt_date:
+    return d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+
+def _resync_message(table_id: int) -> str:
+    return json.dumps({"type": "resync", "table_id": table_id})
+
+
+class RowEventHub:
+    """LISTEN connection and subscriber queues of one worker."""
+
+    def __init__(self):
+        self._subscribers = {}  # table_id -> set of asyncio.Queue
+        self._pending = {}  # table_id -> (first changed day, last changed day)
+        self._task = None
+        self._flush_task = None
+        self.listening = False
+        self.stats = {"notifications": 0, "messages": 0, "dropped": 0, "reconnects": 0}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # Background tasks must not inherit a request's database session.
+        return asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+
+    def start(self):
+        if self._task is None:
+            self._task = self._spawn(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, self._flush_task) if t is not None]
+        self._task = self._flush_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        reconnect = False
+        while True:
+            try:
+                conn = await asyncpg.connect(os.getenv("DATABASE_URL"))
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Realtime listener cannot connect: %s", e)
+                await asyncio.sleep(REALTIME_RECONNECT_SECONDS)
+                continue
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: lost.set())
+            try:
+                await conn.add_listener(ROW_EVENTS_CHANNEL, self._on_notify)
+                self.listening = True
+                if reconnect:
+                    # Changes made while we were not listening are unknown.
+                    self.stats["reconnects"] += 1
+                    for table_id in list(self._subscribers):
+                        self._publish(table_id, _resync_message(table_id))
+                await lost.wait()
+            finally:
+                self.listening = False
+                if not conn.is_closed():
+                    conn.terminate()
+            reconnect = True
+            await asyncio.sleep(REALTIME_RECONNECT_SECONDS)
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str):
+        self.stats["notifications"] += 1
+        try:
+            event = json.loads(payload)
+            table_id = int(event["table_id"])
+            first = dt_date.fromisoformat(event["from"])
+            last = dt_date.fromisoformat(event["to"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if table_id not in self._subscribers:
+            return
+        pending = self._pending.get(table_id)
+        if pending is not None:
+            first, last = min(first, pending[0]), max(last, pending[1])
+        self._pending[table_id] = (first, last)
+        if self._flush_task is None:
+            self._flush_task = self._spawn(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(REALTIME_BATCH_SECONDS)
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        for table_id, (first, last) in pending.items():
+            if table_id not in self._subscribers:
+                continue
+            to_date = _month_end(last)
+            try:
+                rows = await list_rows_async(table_id, first.isoformat(), to_date.isoformat())
+            except Exception:
+                logger.exception("Realtime update for table %s failed", table_id)
+                self._publish(table_id, _resync_message(table_id))
+                continue
+            message = dumps({
+                "type": "rows",
+                "table_id": table_id,
+                "from": first,
+                "to": to_date,
+                "rows": rows,
+            }).decode("utf-8")
+            self._publish(table_id, message)
+
+    def _publish(self, table_id: int, message: str):
+        for queue in self._subscribers.get(table_id, ()):
+            self.stats["messages"] += 1
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A client this far behind just reloads.
+                self.stats["dropped"] += queue.qsize()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_resync_message(table_id))
+
+    def subscribe(self, table_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+        self._subscribers.setdefault(table_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, table_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(table_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[table_id]
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "listening": self.listening,
+            "tables": len(self._subscribers),
+            "clients": sum(len(q) for q in self._subscribers.values()),
+        }
+
+
+hub = RowEventHub()
+
+
+def start_realtime():
+    if REALTIME_ENABLED:
+        hub.start()
+
+
+async def stop_realtime():
+    await hub.stop()
+
+
+def realtime_stats() -> dict:
+    return hub.snapshot()
+
+
+async def serve_websocket(websocket: WebSocket, table_id: int):
+    """Push messages for table_id until the client disconnects."""
+    await websocket.accept()
+    queue = hub.subscribe(table_id)
+
+    async def push():
+        while True:
+            await websocket.send_text(await queue.get())
+
+    async def drain():
+        # Clients don't send anything; reading is how a disconnect shows up.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(push()), asyncio.create_task(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        hub.unsubscribe(table_id, queue)
+
+
+async def sse_events(table_id: int):
+    """text/event-stream body for table_id; ends when the client goes away."""
+    queue = hub.subscribe(table_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), REALTIME_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {message}\n\n"
+    finally:
+        hub.unsubscribe(table_id, queue)
@@ -0,0 +1,57 @@
+from datetime import date as dt_date
+
+from app.models.rows import ROLLUP_PERIODS, get_month_totals_rollup_async
+from app.utils.numbers import pct, round2
+
+
+def _metric(row: dict, prefix: str, unit: str) -> dict:
+    fact = row.pop(f"{prefix}_fact_{unit}") or 0.0
+    plan_month = row.pop(f"{prefix}_plan_month_{unit}")
+    plan_td = row.pop(f"{prefix}_plan_to_date_{unit}") or 0.0
+    return {
+        f"{prefix}_fact_to_date_{unit}": round2(fact),
+        f"{prefix}_plan_{unit}": round2(plan_month),
+        f"{prefix}_plan_to_date_{unit}": round2(plan_td),
+        f"{prefix}_dev_to_date_{unit}": round2(fact - plan_td),
+        f"{prefix}_pct_to_date": round2(pct(fact, plan_td)),
+    }
+
+
+async def get_rollup_async(
+    from_date: str,
+    to_date: str,
+    period: str = "month",
+    template_id: int | None = None,
+) -> list[dict]:
+    """
+    Production and overburden totals per template and period ("month",
+    "year" or "total") from the monthly summaries. from_date and to_date
+    are widened to whole months. *_plan_* is the sum of the month plans,
+    *_plan_to_date_* the plan up to each month's last row, which the
+    deviation and percentage compare against.
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unsupported period: {period}")
+    try:
+        month_from = dt_date.fromisoformat(from_date).replace(day=1)
+        month_to = dt_date.fromisoformat(to_date).replace(day=1)
+    except ValueError:
+        raise ValueError("Invalid date, use YYYY-MM-DD")
+    if month_from > month_to:
+        raise ValueError("from must not be after to")
+
+    rows = await get_month_totals_rollup_async(month_from, month_to, period, template_id)
+    out = []
+    for row in rows:
+        res = {
+            "template_id": row["template_id"],
+            "period": row["period"].isoformat(),
+            "tables": row["tables"],
+            "months": row["months"],
+            "row_count": row["row_count"],
+            "last_row_date": row["last_row_date"].isoformat(),
+        }
+        res.update(_metric(row, "prod", "t"))
+        res.update(_metric(row, "ovb", "m3"))
+        out.append(res)
+    return out
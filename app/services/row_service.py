@@ -1,129 +1,178 @@
 from datetime import date as dt_date
 import calendar
+import os
 
-from app.services.template_service import get_template_schema_for_table
+from app.services.template_service import (
+    get_compiled_template_for_table,
+    get_compiled_template_for_table_async,
+    template_formulas_of,
+)
 from app.utils.sanitize import filter_editable_keys
-from app.models.rows import upsert_row, get_rows, get_row
+from app.utils.numbers import round2 as _round2, pct as _pct
+from app.services.compute_engine import compute_running_fields
+from app.services.formulas import BUILTIN_FORMULAS
+from app.services.month_cache import (
+    apply_saved_row,
+    cached_rows,
+    cached_rows_async,
+    invalidate_months,
+)
+from app.db import db_session
+from app.models.rows import (
+    upsert_row,
+    upsert_row_async,
+    upsert_rows,
+    patch_rows_in_range,
+    get_rows,
+    get_rows_async,
+    get_rows_with_running_totals,
+    get_rows_with_running_totals_async,
+    RUNNING_TOTAL_COLUMNS,
+)
+
+MAX_BULK_ROWS = int(os.getenv("MAX_BULK_ROWS", "1000"))
+# "python": running to-date sums are computed in-process by compute_engine.
+# "sql": Postgres computes them with window functions and returns only the window.
+ROW_TOTALS_MODE = os.getenv("ROW_TOTALS_MODE", "python")
 
 def save_row(table_id: int, row_date: str, incoming_data: dict, user_id: int) -> dict:
-    schema = get_template_schema_for_table(table_id)
-    clean = filter_editable_keys(schema, incoming_data)
+    compiled = get_compiled_template_for_table(table_id)
+    clean = filter_editable_keys(
+        compiled["template"]["schema_json"],
+        incoming_data,
+        editable=compiled["editable_keys"],
+    )
+
+    # Merge into the stored data in the database so unchanged fields are preserved.
+    row = upsert_row(
+        table_id=table_id,
+        row_date=row_date,
+        data=clean,
+        user_id=user_id,
+        merge=True,
+    )
+    apply_saved_row(table_id, row)
+    return row
 
-    # Merge with existing stored data so unchanged fields are preserved.
-    existing = get_row(table_id=table_id, row_date=row_date)
-    existing_data = existing.get("data") if existing else {}
-    merged = {**(existing_data or {}), **clean}
 
-    return upsert_row(
+async def save_row_async(table_id: int, row_date: str, incoming_data: dict, user_id: int) -> dict:
+    compiled = await get_compiled_template_for_table_async(table_id)
+    clean = filter_editable_keys(
+        compiled["template"]["schema_json"],
+        incoming_data,
+        editable=compiled["editable_keys"],
+    )
+    row = await upsert_row_async(
         table_id=table_id,
         row_date=row_date,
-        data=merged,
+        data=clean,
+        user_id=user_id,
+        merge=True,
+    )
+    apply_saved_row(table_id, row)
+    return row
+
+
+def save_rows(table_id: int, entries: dict, user_id: int) -> dict:
+    """
+    Bulk save_row: entries maps row_date -> incoming data. All entries are
+    filtered with one template lookup and merged into table_rows with a
+    single statement. Entries with a bad date or payload are reported in
+    "errors" and skipped; everything else is saved.
+    """
+    compiled = get_compiled_template_for_table(table_id)
+    schema = compiled["template"]["schema_json"]
+
+    cleaned = {}
+    errors = []
+    for raw_date, incoming in entries.items():
+        try:
+            row_date = dt_date.fromisoformat(str(raw_date))
+        except ValueError:
+            errors.append({"row_date": raw_date, "error": "Invalid date, use YYYY-MM-DD"})
+            continue
+        if not isinstance(incoming, dict):
+            errors.append({"row_date": raw_date, "error": "Row data must be an object"})
+            continue
+        clean = filter_editable_keys(schema, incoming, editable=compiled["editable_keys"])
+        # Two spellings of the same date collapse into one row, later keys win.
+        cleaned[row_date] = {**cleaned.get(row_date, {}), **clean}
+
+    saved = upsert_rows(
+        table_id=table_id,
+        rows=list(cleaned.items()),
         user_id=user_id,
+        merge=True,
     )
+    invalidate_months(table_id, cleaned)
+    for row in saved:
+        if isinstance(row.get("row_date"), dt_date):
+            row["row_date"] = row["row_date"].isoformat()
+    return {"rows": saved, "errors": errors}
 
 
-def list_rows(table_id: int, from_date: str, to_date: str) -> list[dict]:
+def list_rows(table_id: int, from_date: str, to_date: str, mode: str | None = None) -> list[dict]:
     # Always compute cumulative from the start of the month to ensure correct to-date values
     # even when the requested window starts mid-month.
     from_dt = dt_date.fromisoformat(from_date)
-    to_dt = dt_date.fromisoformat(to_date)
     month_start = from_dt.replace(day=1).isoformat()
+    formulas = template_formulas_of(get_compiled_template_for_table(table_id))
+    # The sql mode only knows the built-in formulas.
+    if (mode or ROW_TOTALS_MODE) == "sql" and formulas["builtin"]:
+        rows = get_rows_with_running_totals(table_id, month_start, from_date, to_date)
+        return [_row_from_totals(r) for r in rows]
+    cached = cached_rows(table_id, from_date, to_date, formulas)
+    if cached is not None:
+        return cached
+    rows = get_rows(table_id, month_start, to_date, formulas["sources"])
+    return compute_rows(rows, from_date, to_date, formulas, in_place=True)
 
-    rows = get_rows(table_id, month_start, to_date)
-    rows_sorted = sorted(rows, key=lambda r: _to_date(r["row_date"]))
-
-    running_prod = 0.0
-    running_ovb = 0.0
-    running_prod_plan = 0.0
-    running_ovb_plan = 0.0
-    prod_plan_month_total = None
-    ovb_plan_month_total = None
-    days_in_month = calendar.monthrange(from_dt.year, from_dt.month)[1]
-    prod_plan_day_value = 0.0
-    ovb_plan_day_value = 0.0
-    computed = []
-    for row in rows_sorted:
-        data = row.get("data") or {}
-        prod_day = _to_number(data.get("prod_fact_day_t")) or 0.0
-        ovb_day = _to_number(data.get("ovb_fact_day_m3")) or 0.0
-
-        if prod_plan_month_total is None:
-            prod_plan_month_total = _to_number(data.get("prod_plan_to_date_t"))
-        if ovb_plan_month_total is None:
-            ovb_plan_month_total = _to_number(data.get("ovb_plan_to_date_m3"))
-
-        prod_plan_day_value = (prod_plan_month_total or 0.0) / days_in_month
-        ovb_plan_day_value = (ovb_plan_month_total or 0.0) / days_in_month
-
-        running_prod += prod_day
-        running_ovb += ovb_day
-        running_prod_plan += prod_plan_day_value
-        running_ovb_plan += ovb_plan_day_value
-
-        computed.append(
-            add_computed_fields(
-                row,
-                running_prod,
-                running_ovb,
-                running_prod_plan,
-                running_ovb_plan,
-                prod_plan_day_value,
-                ovb_plan_day_value,
-            )
-        )
 
-    # Return only rows within the requested window, keeping the computed to-date values.
-    filtered = [
-        r
-        for r in computed
-        if from_dt <= _to_date(r["row_date"]) <= to_dt
-    ]
-
-    # Normalize row_date to ISO strings in the response.
-    for r in filtered:
-        if isinstance(r.get("row_date"), dt_date):
-            r["row_date"] = r["row_date"].isoformat()
-
-    return filtered
+async def list_rows_async(table_id: int, from_date: str, to_date: str, mode: str | None = None) -> list[dict]:
+    from_dt = dt_date.fromisoformat(from_date)
+    month_start = from_dt.replace(day=1).isoformat()
+    formulas = template_formulas_of(await get_compiled_template_for_table_async(table_id))
+    if (mode or ROW_TOTALS_MODE) == "sql" and formulas["builtin"]:
+        rows = await get_rows_with_running_totals_async(table_id, month_start, from_date, to_date)
+        return [_row_from_totals(r) for r in rows]
+    cached = await cached_rows_async(table_id, from_date, to_date, formulas)
+    if cached is not None:
+        return cached
+    rows = await get_rows_async(table_id, month_start, to_date, formulas["sources"])
+    return compute_rows(rows, from_date, to_date, formulas, in_place=True)
 
 
-def _to_date(value):
-    if isinstance(value, dt_date):
-        return value
-    return dt_date.fromisoformat(str(value))
+def _row_from_totals(row: dict) -> dict:
+    # Same values as add_computed_fields; rounding stays in Python so both
+    # modes return identical values. The row was just fetched for this
+    # request, so it is filled in place.
+    totals = [row.pop(col) for col in RUNNING_TOTAL_COLUMNS]
+    row["data"] = _set_computed_fields(row.get("data") or {}, *totals)
+    if isinstance(row.get("row_date"), dt_date):
+        row["row_date"] = row["row_date"].isoformat()
+    return row
 
 
-def _to_number(v):
+def compute_rows(
+    rows: list[dict],
+    from_date: str,
+    to_date: str,
+    formulas: dict = BUILTIN_FORMULAS,
+    in_place: bool = False,
+) -> list[dict]:
     """
-    Convert value to float; return None if it cannot be parsed.
-    This keeps bad user input from crashing the view loader.
+    Add the template's computed fields to rows fetched (ordered by row_date)
+    from the start of the month of from_date and return only those inside
+    [from_date, to_date]. Sums and plans reset at every month boundary.
+    in_place fills in the fetched rows instead of copying them.
     """
-    if v is None:
-        return None
-    if isinstance(v, (int, float)):
-        return float(v)
-    if isinstance(v, str):
-        stripped = v.strip()
-        if stripped == "":
-            return None
-        try:
-            return float(stripped)
-        except ValueError:
-            return None
-    return None
-
-
-def _round2(v):
-    if v is None:
-        return None
-    return round(v, 2)
-
-def _pct(fact, plan):
-    plan = _to_number(plan)
-    fact = _to_number(fact)
-    if plan is None or fact is None or plan == 0:
-        return None
-    return 100.0 * fact / plan
+    return compute_running_fields(
+        rows,
+        dt_date.fromisoformat(from_date),
+        dt_date.fromisoformat(to_date),
+        formulas,
+        in_place,
+    )
 
 
 def add_computed_fields(
@@ -135,10 +184,29 @@ def add_computed_fields(
     prod_plan_day: float,
     ovb_plan_day: float,
 ) -> dict:
-    data = row.get("data") or {}
     # Work on a copy so we don't mutate unexpectedly
-    out_data = dict(data)
+    out = dict(row)
+    out["data"] = _set_computed_fields(
+        dict(row.get("data") or {}),
+        prod_fact_to_date,
+        ovb_fact_to_date,
+        prod_plan_to_date,
+        ovb_plan_to_date,
+        prod_plan_day,
+        ovb_plan_day,
+    )
+    return out
+
 
+def _set_computed_fields(
+    out_data: dict,
+    prod_fact_to_date: float,
+    ovb_fact_to_date: float,
+    prod_plan_to_date: float,
+    ovb_plan_to_date: float,
+    prod_plan_day: float,
+    ovb_plan_day: float,
+) -> dict:
     # Production computed fields (to-date fact and plan are enforced from running sums)
     prod_plan_td = prod_plan_to_date
     out_data["prod_fact_to_date_t"] = _round2(prod_fact_to_date)
@@ -156,11 +224,7 @@ def add_computed_fields(
     if ovb_plan_td is not None:
         out_data["ovb_dev_to_date_m3"] = _round2(ovb_fact_to_date - ovb_plan_td)
     out_data["ovb_pct_to_date"] = _round2(_pct(ovb_fact_to_date, ovb_plan_td))
-
-    # Return row with augmented data
-    out = dict(row)
-    out["data"] = out_data
-    return out
+    return out_data
 
 
 def set_month_plan(
@@ -172,34 +236,44 @@ def set_month_plan(
 ) -> list[dict]:
     """
     Update or set monthly plan totals for all rows in the month. Creates a stub
-    row on the first day if none exist.
+    row on the first day if none exist. Runs as a single statement.
     """
     month_end = month_start.replace(
         day=calendar.monthrange(month_start.year, month_start.month)[1]
     )
-    rows = get_rows(table_id, month_start.isoformat(), month_end.isoformat())
+    patch = {}
+    if prod_plan_month is not None:
+        patch["prod_plan_to_date_t"] = prod_plan_month
+    if ovb_plan_month is not None:
+        patch["ovb_plan_to_date_m3"] = ovb_plan_month
 
-    targets = rows or [
-        {
-            "table_id": table_id,
-            "row_date": month_start.isoformat(),
-            "data": {},
-        }
-    ]
+    updated = patch_rows_in_range(
+        table_id=table_id,
+        date_from=month_start.isoformat(),
+        date_to=month_end.isoformat(),
+        patch=patch,
+        user_id=user_id,
+        stub_date=month_start.isoformat(),
+    )
+    invalidate_months(table_id, [month_start])
+    return updated
 
+
+def set_month_plans(plans: list[dict], user_id: int) -> list[dict]:
+    """
+    Apply several set_month_plan updates atomically. Each item has table_id,
+    month_start and optional prod_plan_month / ovb_plan_month.
+    """
     updated = []
-    for row in targets:
-        data = dict(row.get("data") or {})
-        if prod_plan_month is not None:
-            data["prod_plan_to_date_t"] = prod_plan_month
-        if ovb_plan_month is not None:
-            data["ovb_plan_to_date_m3"] = ovb_plan_month
-        updated.append(
-            upsert_row(
-                table_id=table_id,
-                row_date=row["row_date"],
-                data=data,
-                user_id=user_id,
+    with db_session():
+        for plan in plans:
+            updated.extend(
+                set_month_plan(
+                    table_id=plan["table_id"],
+                    month_start=plan["month_start"],
+                    user_id=user_id,
+                    prod_plan_month=plan.get("prod_plan_month"),
+                    ovb_plan_month=plan.get("ovb_plan_month"),
+                )
             )
-        )
     return updated
@@ -1,6 +1,10 @@
-from app.models.tables import get_table
-from app.models.templates import get_template
-from app.services.row_service import list_rows
+import hashlib
+from datetime import date as dt_date
+
+from app.models.rows import get_view_validator_async
+from app.models.tables import get_table, get_table_async
+from app.services.template_service import get_cached_template, get_compiled_template_async
+from app.services.row_service import list_rows, list_rows_async
 
 
 def get_table_view(table_id: int, from_date: str, to_date: str) -> dict:
@@ -8,7 +12,7 @@ def get_table_view(table_id: int, from_date: str, to_date: str) -> dict:
     table = get_table(table_id)
 
     # 2) Load template schema used by this table
-    template = get_template(table["template_id"])
+    template = get_cached_template(table["template_id"])
 
     # 3) Load rows for date range (already includes computed fields)
     rows = list_rows(table_id=table_id, from_date=from_date, to_date=to_date)
@@ -19,3 +23,56 @@ def get_table_view(table_id: int, from_date: str, to_date: str) -> dict:
         "template": template,
         "rows": rows,
     }
+
+
+async def get_table_view_async(table_id: int, from_date: str, to_date: str) -> dict:
+    table = await get_table_async(table_id)
+    template = (await get_compiled_template_async(table["template_id"]))["template"]
+    rows = await list_rows_async(table_id=table_id, from_date=from_date, to_date=to_date)
+    return {
+        "table": table,
+        "template": template,
+        "rows": rows,
+    }
+
+
+# Bump when the view payload format changes so clients drop cached copies.
+VIEW_FORMAT_VERSION = "1"
+
+
+async def get_table_view_etag_async(table_id: int, from_date: str, to_date: str) -> str | None:
+    """
+    Weak ETag for get_table_view_async. Rows from the start of the month count
+    too since they feed the to-date values in the window. None when the table
+    does not exist (the view itself reports that).
+    """
+    month_start = dt_date.fromisoformat(from_date).replace(day=1).isoformat()
+    validator = await get_view_validator_async(table_id, month_start, to_date)
+    if validator is None:
+        return None
+    template_version = (await get_compiled_template_async(validator["template_id"]))["version"]
+    parts = [
+        VIEW_FORMAT_VERSION,
+        from_date,
+        to_date,
+        template_version,
+        *(str(validator[k]) for k in (
+            "id", "template_id", "name", "is_archived",
+            "row_count", "version_sum", "max_version", "max_updated_at",
+        )),
+    ]
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Weak comparison against an If-None-Match header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == bare
+        for candidate in if_none_match.split(",")
+    )
@@ -1,7 +1,128 @@
-from app.models.tables import get_table
-from app.models.templates import get_template
+import hashlib
+import json
+import os
+
+from app.models.tables import get_table, get_table_async
+from app.models.templates import get_template, get_template_async, list_templates
+from app.models.typed_columns import add_typed_columns, get_typed_keys
+from app.services.formulas import FormulaError, template_formulas
+from app.utils.cache import TTLCache
+from app.utils.sanitize import editable_keys, numeric_keys
+
+TEMPLATE_CACHE_TTL_SECONDS = float(os.getenv("TEMPLATE_CACHE_TTL_SECONDS", "300"))
+
+# template_id -> compiled template, table_id -> template_id
+_templates = TTLCache(maxsize=256, ttl=TEMPLATE_CACHE_TTL_SECONDS)
+_table_templates = TTLCache(maxsize=4096, ttl=TEMPLATE_CACHE_TTL_SECONDS)
+
+
+def schema_version(schema_json: dict) -> str:
+    canonical = json.dumps(schema_json, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_template(template: dict) -> dict:
+    """
+    Precompute what the row services need from a template: the editable and
+    numeric key sets, the compiled formulas, column metadata by key and a
+    content hash used as the template version. Invalid formulas don't fail
+    the template (saves don't need them): formulas is None and
+    formula_error says why, see template_formulas_of.
+    """
+    schema = template.get("schema_json") or {}
+    try:
+        formulas, formula_error = template_formulas(schema), None
+    except FormulaError as e:
+        formulas, formula_error = None, str(e)
+    return {
+        "template": template,
+        "version": schema_version(schema),
+        "editable_keys": editable_keys(schema),
+        "numeric_keys": numeric_keys(schema),
+        "formulas": formulas,
+        "formula_error": formula_error,
+        "columns": {c["key"]: c for c in schema.get("columns", []) if "key" in c},
+    }
+
+
+def template_formulas_of(compiled: dict) -> dict:
+    """The compiled formulas of a compiled template; FormulaError if invalid."""
+    if compiled["formulas"] is None:
+        raise FormulaError(f"Template {compiled['template'].get('id')}: {compiled['formula_error']}")
+    return compiled["formulas"]
+
+
+def get_compiled_template(template_id: int) -> dict:
+    compiled = _templates.get(template_id)
+    if compiled is None:
+        compiled = compile_template(get_template(template_id))
+        _templates.set(template_id, compiled)
+    return compiled
+
+
+async def get_compiled_template_async(template_id: int) -> dict:
+    compiled = _templates.get(template_id)
+    if compiled is None:
+        compiled = compile_template(await get_template_async(template_id))
+        _templates.set(template_id, compiled)
+    return compiled
+
+
+def get_cached_template(template_id: int) -> dict:
+    # Shared between requests: treat the returned dict as read-only.
+    return get_compiled_template(template_id)["template"]
+
+
+def get_template_id_for_table(table_id: int) -> int:
+    template_id = _table_templates.get(table_id)
+    if template_id is None:
+        template_id = get_table(table_id)["template_id"]
+        _table_templates.set(table_id, template_id)
+    return template_id
+
+
+async def get_template_id_for_table_async(table_id: int) -> int:
+    template_id = _table_templates.get(table_id)
+    if template_id is None:
+        template_id = (await get_table_async(table_id))["template_id"]
+        _table_templates.set(table_id, template_id)
+    return template_id
+
+
+def get_compiled_template_for_table(table_id: int) -> dict:
+    return get_compiled_template(get_template_id_for_table(table_id))
+
+
+async def get_compiled_template_for_table_async(table_id: int) -> dict:
+    return await get_compiled_template_async(await get_template_id_for_table_async(table_id))
+
 
 def get_template_schema_for_table(table_id: int) -> dict:
-    table = get_table(table_id)
-    template = get_template(table["template_id"])
-    return template["schema_json"]
+    return get_compiled_template_for_table(table_id)["template"]["schema_json"]
+
+
+def invalidate_template_cache(template_id: int | None = None):
+    """Forget cached templates (all of them when template_id is None)."""
+    if template_id is None:
+        _templates.clear()
+        _table_templates.clear()
+        return
+    _templates.pop(template_id)
+    _table_templates.discard_where(lambda _, tid: tid == template_id)
+
+
+def template_cache_stats() -> dict:
+    return {"templates": _templates.stats(), "table_templates": _table_templates.stats()}
+
+
+def sync_typed_columns() -> dict:
+    """
+    Make sure every column marked "type": "number" in any template has a
+    typed column on table_rows. Returns the keys added and all typed keys.
+    """
+    keys = set()
+    for template in list_templates():
+        # Only the numeric keys: a template with broken formulas still counts.
+        keys |= numeric_keys(template.get("schema_json") or {})
+    added = add_typed_columns(keys)
+    return {"added": added, "typed": sorted(get_typed_keys())}
@@ -0,0 +1,47 @@
+def to_number(v):
+    """
+    Convert value to float; return None if it cannot be parsed.
+    This keeps bad user input from crashing the view loader.
+    """
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        try:
+            return float(v)
+        except OverflowError:
+            # Integers past float range, like float("1e400") does for strings.
+            return float("inf") if v > 0 else float("-inf")
+    if isinstance(v, str):
+        stripped = v.strip()
+        if stripped == "":
+            return None
+        try:
+            return float(stripped)
+        except ValueError:
+            return None
+    return None
+
+
+def round2(v):
+    if v is None:
+        return None
+    return round(v, 2)
+
+
+def pct(fact, plan):
+    plan = to_number(plan)
+    fact = to_number(fact)
+    if plan is None or fact is None or plan == 0:
+        return None
+    return 100.0 * fact / plan
+
+
+# Stored generated float8 columns of table_rows mirroring numeric data keys
+# (see app.models.typed_columns) are named with this prefix.
+TYPED_COLUMN_PREFIX = "num_"
+
+
+def typed_column(key: str) -> str:
+    if not (key.isascii() and key.replace("_", "").isalnum()) or len(key) > 59:
+        raise ValueError(f"Unsupported key: {key}")
+    return TYPED_COLUMN_PREFIX + key
@@ -1,8 +1,22 @@
 import json
 
-def filter_editable_keys(schema_json: dict, incoming: dict) -> dict:
-    editable = {
+def editable_keys(schema_json: dict) -> frozenset:
+    return frozenset(
         c["key"] for c in schema_json.get("columns", [])
         if c.get("editable") is True
-    }
+    )
+
+
+def numeric_keys(schema_json: dict) -> frozenset:
+    # Columns marked "type": "number" get a typed column (app.models.typed_columns).
+    return frozenset(
+        c["key"] for c in schema_json.get("columns", [])
+        if "key" in c and c.get("type") == "number"
+    )
+
+
+def filter_editable_keys(schema_json: dict, incoming: dict, editable: frozenset | None = None) -> dict:
+    # Callers holding a compiled template pass its precomputed key set.
+    if editable is None:
+        editable = editable_keys(schema_json)
     return {k: incoming[k] for k in incoming.keys() if k in editable}
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the view and save hot paths (not tests). See README.txt.
+
+    python -m bench.micro [--save-baseline | --compare]
+    BENCH_DATABASE_URL=... python -m bench.endpoints --seed [--save-baseline | --compare]
+"""
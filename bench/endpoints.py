@@ -0,0 +1,164 @@
+"""
+In-process HTTP benchmarks (FastAPI TestClient, no network) against a
+throwaway Postgres database:
+
+    BENCH_DATABASE_URL=postgresql://.../xl_bench python -m bench.endpoints --create-schema --seed
+    BENCH_DATABASE_URL=... python -m bench.endpoints --compare
+
+--seed replaces the benchmark templates/tables (names starting "bench-") and
+writes rows, so never point BENCH_DATABASE_URL at a database you care about.
+"""
+import itertools
+import os
+import random
+import sys
+from datetime import date as dt_date, timedelta
+
+from bench.runner import arg_parser, finish, run
+from bench.synthetic import (
+    BENCH_USER_EMAIL,
+    BENCH_USER_PASSWORD,
+    add_months,
+    create_schema,
+    find_seeded,
+    seed_database,
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline-endpoints.json")
+
+
+def _check(response, expected: int = 200):
+    if response.status_code != expected:
+        raise RuntimeError(
+            f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:200]}"
+        )
+    return response
+
+
+def benchmarks(client, seeded: dict) -> list:
+    token = _check(
+        client.post("/auth/login", json={"login": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD})
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    rng = random.Random(0)
+
+    start = seeded["start"]
+    month_tables = itertools.cycle(seeded["month_tables"])  # (table_id, month)
+    period_table = seeded["period_tables"][0]
+
+    def month_view():
+        # Month tables rotate, so consecutive requests read different rows.
+        table_id, period = next(month_tables)
+        _check(client.get(
+            f"/tables/{table_id}/view",
+            params={"from": period.isoformat(), "to": (add_months(period, 1) - timedelta(days=1)).isoformat()},
+            headers=headers,
+        ))
+
+    def period_view(months: int):
+        params = {
+            "from": start.isoformat(),
+            "to": min(add_months(start, months) - timedelta(days=1), seeded["end"]).isoformat(),
+        }
+        return lambda: _check(client.get(f"/tables/{period_table}/view", params=params, headers=headers))
+
+    month_params = {"from": start.isoformat(), "to": (add_months(start, 1) - timedelta(days=1)).isoformat()}
+    etag = _check(
+        client.get(f"/tables/{period_table}/view", params=month_params, headers=headers)
+    ).headers.get("etag")
+
+    def not_modified():
+        _check(
+            client.get(
+                f"/tables/{period_table}/view",
+                params=month_params,
+                headers={**headers, "If-None-Match": etag or ""},
+            ),
+            304 if etag else 200,
+        )
+
+    days = (seeded["end"] - start).days + 1
+
+    def save_row():
+        # Random day of the period table: the month cache recomputes its tail.
+        day = start + timedelta(days=rng.randrange(days))
+        _check(client.put(
+            f"/debug/tables/{period_table}/rows/{day.isoformat()}",
+            json={"prod_fact_day_t": round(rng.uniform(800, 1200), 2)},
+            headers=headers,
+        ))
+
+    def save_rows_week():
+        first = start + timedelta(days=rng.randrange(days - 7))
+        rows = {
+            (first + timedelta(days=i)).isoformat(): {"ovb_fact_day_m3": round(rng.uniform(4000, 6000), 1)}
+            for i in range(7)
+        }
+        _check(client.put(f"/tables/{period_table}/rows", json={"rows": rows}, headers=headers))
+
+    rollup_params = {"from": start.isoformat(), "to": seeded["end"].isoformat(), "period": "month"}
+
+    def rollup():
+        _check(client.get("/templates/rollup", params=rollup_params, headers=headers))
+
+    def login():
+        _check(client.post("/auth/login", json={"login": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD}))
+
+    return [
+        ("view/month", month_view, 300),
+        ("view/month_not_modified", not_modified, 300),
+        ("view/quarter", period_view(3), 200),
+        ("view/year", period_view(12), 100),
+        ("save_row", save_row, 300),
+        ("save_rows/week", save_rows_week, 200),
+        ("rollup/months", rollup, 200),
+        # bcrypt dominates; see BCRYPT_ROUNDS.
+        ("auth/login", login, 20),
+    ]
+
+
+def main(argv=None) -> int:
+    parser = arg_parser("In-process HTTP benchmarks of the view, save and login paths", DEFAULT_BASELINE)
+    parser.add_argument("--create-schema", action="store_true", help="create the tables (bench/schema.sql) first")
+    parser.add_argument("--seed", action="store_true", help="(re)generate the synthetic data first")
+    parser.add_argument(
+        "--typed-columns", action="store_true", help="add the typed numeric columns (admin sync) first"
+    )
+    parser.add_argument("--templates", type=int, default=2)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--start", type=dt_date.fromisoformat, default=dt_date(2026, 1, 1))
+    args = parser.parse_args(argv)
+
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        print("Set BENCH_DATABASE_URL to a throwaway database", file=sys.stderr)
+        return 2
+    # The app reads these at import time.
+    os.environ["DATABASE_URL"] = dsn
+    os.environ.setdefault("REALTIME_ENABLED", "0")
+
+    if args.create_schema:
+        create_schema(dsn)
+    if args.seed:
+        seeded = seed_database(dsn, args.templates, args.months, args.start)
+    else:
+        seeded = find_seeded(dsn)
+        if seeded is None:
+            print("No benchmark data; run with --seed first", file=sys.stderr)
+            return 2
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.services.template_service import sync_typed_columns
+
+    if args.typed_columns:
+        print("typed columns:", sync_typed_columns()["typed"])
+
+    with TestClient(app) as client:
+        results = run(benchmarks(client, seeded), args)
+    return finish(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
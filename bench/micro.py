@@ -0,0 +1,74 @@
+"""
+Micro-benchmarks of the computed-field pipeline on synthetic rows, no
+database needed:
+
+    python -m bench.micro [--filter year] [--save-baseline | --compare]
+"""
+import os
+import sys
+from datetime import date as dt_date
+
+from app.services.compute_engine import carry_at, running_totals
+from app.services.row_service import add_computed_fields, compute_rows
+from bench.runner import arg_parser, finish, run
+from bench.synthetic import synthetic_rows
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline-micro.json")
+
+# name -> (first day, days); every span starts on the 1st like list_rows reads.
+SPANS = {
+    "month": (dt_date(2026, 1, 1), 31),
+    "quarter": (dt_date(2026, 1, 1), 90),
+    "year": (dt_date(2026, 1, 1), 365),
+}
+# Larger spans run fewer times so every benchmark takes about as long.
+ITERATIONS = {"month": 2000, "quarter": 700, "year": 200}
+
+
+# add_computed_fields' arguments after the row.
+_TOTALS_ARGS = (
+    "prod_fact_to_date_t",
+    "ovb_fact_to_date_m3",
+    "prod_plan_to_date_t",
+    "ovb_plan_to_date_m3",
+    "prod_plan_day_t",
+    "ovb_plan_day_m3",
+)
+
+
+def add_computed_fields_loop(rows: list) -> list:
+    """The per-row path of the sql mode: one add_computed_fields call per row."""
+    state = running_totals(rows)
+    out = []
+    for i, row in enumerate(rows):
+        c = carry_at(state, i)
+        out.append(add_computed_fields(row, *(c[key][0] for key in _TOTALS_ARGS)))
+    return out
+
+
+def benchmarks() -> list:
+    result = []
+    for span, (start, days) in SPANS.items():
+        rows = synthetic_rows(start, days)
+        first = rows[0]["row_date"].isoformat()
+        last = rows[-1]["row_date"].isoformat()
+        n = ITERATIONS[span]
+        result += [
+            (f"compute_rows/{span}", lambda r=rows, a=first, b=last: compute_rows(r, a, b), n),
+            (f"running_totals/{span}", lambda r=rows: running_totals(r), n),
+            (f"add_computed_fields/{span}", lambda r=rows: add_computed_fields_loop(r), n),
+        ]
+    # A window in the last week still computes from the 1st of the month.
+    rows = synthetic_rows(*SPANS["month"])
+    tail, last = rows[-7]["row_date"].isoformat(), rows[-1]["row_date"].isoformat()
+    result.append(("compute_rows/last_week", lambda: compute_rows(rows, tail, last), ITERATIONS["month"]))
+    return result
+
+
+def main(argv=None) -> int:
+    args = arg_parser("Computed-field pipeline micro-benchmarks", DEFAULT_BASELINE).parse_args(argv)
+    return finish(run(benchmarks(), args), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Timing, reporting and baseline comparison shared by the benchmark scripts.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+# A benchmark regresses when its p50 is this much slower than the baseline.
+DEFAULT_TOLERANCE = 0.10
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def measure(fn, iterations: int, warmup: int = 3) -> dict:
+    """Call fn warmup + iterations times; latencies in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "n": iterations,
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "mean_ms": sum(timings) / len(timings),
+        "ops_per_s": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+def arg_parser(description: str, default_baseline: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--iterations", type=int, default=None, help="override every benchmark's iteration count")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=default_baseline, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed p50 slowdown (0.10 = 10%%)")
+    parser.add_argument("--json", dest="json_out", default=None, help="also write the results to this file")
+    return parser
+
+
+def run(benchmarks: list, args) -> dict:
+    """benchmarks: [(name, fn, iterations), ...] -> {name: stats}."""
+    results = {}
+    for name, fn, iterations in benchmarks:
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.iterations or iterations)
+        print(_line(name, results[name]), flush=True)
+    return results
+
+
+def _line(name: str, stats: dict) -> str:
+    return "%-32s n=%-5d p50=%9.3f  p95=%9.3f  p99=%9.3f ms  %10.1f ops/s" % (
+        name, stats["n"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["ops_per_s"],
+    )
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print each benchmark against the baseline; returns the regressed names."""
+    regressions = []
+    print("\n%-32s %12s %12s %9s" % ("benchmark", "base p50", "p50", "change"))
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print("%-32s %12s %12.3f %9s" % (name, "-", stats["p50_ms"], "new"))
+            continue
+        change = stats["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-32s %12.3f %12.3f %+8.1f%%%s" % (name, base["p50_ms"], stats["p50_ms"], change * 100, flag))
+    return regressions
+
+
+def finish(results: dict, args) -> int:
+    """Save / compare as requested by the command line; returns the exit code."""
+    document = {"environment": _environment(), "results": results}
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    if args.compare:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n%d regression(s) above %.0f%%: %s" % (len(regressions), args.tolerance * 100, ", ".join(regressions)))
+            return 1
+    return 0
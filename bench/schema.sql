@@ -0,0 +1,61 @@
+-- Full schema for a throwaway benchmark database (base tables plus every
+-- change listed in README.txt). Only run it against an empty database.
+
+CREATE TABLE IF NOT EXISTS users (
+  id SERIAL PRIMARY KEY,
+  email TEXT UNIQUE NOT NULL,
+  name TEXT NOT NULL,
+  password_hash TEXT NOT NULL,
+  is_active BOOLEAN NOT NULL DEFAULT TRUE,
+  is_admin BOOLEAN NOT NULL DEFAULT FALSE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS table_templates (
+  id SERIAL PRIMARY KEY,
+  name TEXT NOT NULL,
+  description TEXT,
+  schema_json JSONB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tables (
+  id SERIAL PRIMARY KEY,
+  template_id INTEGER NOT NULL REFERENCES table_templates(id),
+  name TEXT NOT NULL,
+  is_archived BOOLEAN NOT NULL DEFAULT FALSE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  period_start DATE,
+  CONSTRAINT tables_template_period_unique UNIQUE (template_id, period_start)
+);
+
+CREATE TABLE IF NOT EXISTS table_rows (
+  id SERIAL PRIMARY KEY,
+  table_id INTEGER NOT NULL REFERENCES tables(id),
+  row_date DATE NOT NULL,
+  data JSONB NOT NULL DEFAULT '{}'::jsonb,
+  created_by INTEGER REFERENCES users(id),
+  updated_by INTEGER REFERENCES users(id),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  version INTEGER NOT NULL DEFAULT 1,
+  UNIQUE (table_id, row_date)
+);
+
+CREATE INDEX IF NOT EXISTS table_rows_table_id_updated_at_idx ON table_rows (table_id, updated_at);
+
+CREATE TABLE IF NOT EXISTS table_month_totals (
+  table_id INTEGER NOT NULL REFERENCES tables(id),
+  template_id INTEGER NOT NULL,
+  month DATE NOT NULL,
+  row_count INTEGER NOT NULL,
+  last_row_date DATE NOT NULL,
+  prod_fact_t DOUBLE PRECISION NOT NULL,
+  prod_plan_month_t DOUBLE PRECISION,
+  prod_plan_to_date_t DOUBLE PRECISION NOT NULL,
+  ovb_fact_m3 DOUBLE PRECISION NOT NULL,
+  ovb_plan_month_m3 DOUBLE PRECISION,
+  ovb_plan_to_date_m3 DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (table_id, month)
+);
+CREATE INDEX IF NOT EXISTS table_month_totals_template_id_month_idx ON table_month_totals (template_id, month);
@@ -0,0 +1,216 @@
+"""
+Synthetic templates, tables and rows for the benchmarks.
+
+Rows look like the ones the app stores: daily fact values, the month plan on
+the 1st, the occasional empty or comma-decimal cell and a comment.
+"""
+import calendar
+import json
+import os
+import random
+from datetime import date as dt_date, datetime, timedelta, timezone
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+BENCH_USER_EMAIL = "bench@example.com"
+BENCH_USER_PASSWORD = "bench-password"
+
+TEMPLATE_SCHEMA = {
+    "columns": [
+        {"key": "row_date", "title": "Date"},
+        {"key": "prod_fact_day_t", "title": "Prod fact, t", "editable": True, "type": "number"},
+        {"key": "prod_plan_to_date_t", "title": "Prod plan, t", "editable": True, "type": "number"},
+        {"key": "prod_fact_to_date_t", "title": "Prod to date, t"},
+        {"key": "prod_plan_day_t", "title": "Prod plan per day, t"},
+        {"key": "prod_dev_to_date_t", "title": "Prod deviation, t"},
+        {"key": "prod_pct_to_date", "title": "Prod %"},
+        {"key": "ovb_fact_day_m3", "title": "Ovb fact, m3", "editable": True, "type": "number"},
+        {"key": "ovb_plan_to_date_m3", "title": "Ovb plan, m3", "editable": True, "type": "number"},
+        {"key": "ovb_fact_to_date_m3", "title": "Ovb to date, m3"},
+        {"key": "ovb_plan_day_m3", "title": "Ovb plan per day, m3"},
+        {"key": "ovb_dev_to_date_m3", "title": "Ovb deviation, m3"},
+        {"key": "ovb_pct_to_date", "title": "Ovb %"},
+        {"key": "comment", "title": "Comment", "editable": True},
+    ]
+}
+
+_SCHEMA_SQL = os.path.join(os.path.dirname(__file__), "schema.sql")
+
+
+def add_months(month: dt_date, n: int) -> dt_date:
+    index = month.year * 12 + month.month - 1 + n
+    return dt_date(index // 12, index % 12 + 1, 1)
+
+
+def day_data(rng: random.Random, day: dt_date) -> dict:
+    data = {
+        "prod_fact_day_t": round(rng.uniform(800, 1200), 2),
+        "ovb_fact_day_m3": round(rng.uniform(4000, 6000), 1),
+    }
+    if day.day == 1:
+        days = calendar.monthrange(day.year, day.month)[1]
+        data["prod_plan_to_date_t"] = 1000 * days
+        data["ovb_plan_to_date_m3"] = 5000 * days
+    roll = rng.random()
+    if roll < 0.05:
+        del data["ovb_fact_day_m3"]
+    elif roll < 0.10:
+        # Typed in by hand with a decimal comma.
+        data["prod_fact_day_t"] = str(data["prod_fact_day_t"]).replace(".", ",")
+    if rng.random() < 0.2:
+        data["comment"] = "shift %d report" % rng.randint(1, 3)
+    return data
+
+
+def synthetic_rows(start: dt_date, days: int, table_id: int = 1, seed: int = 0) -> list[dict]:
+    """days consecutive rows from start, shaped like get_rows() results."""
+    rng = random.Random(seed)
+    stamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        rows.append({
+            "id": i + 1,
+            "table_id": table_id,
+            "row_date": day,
+            "data": day_data(rng, day),
+            "created_by": None,
+            "updated_by": None,
+            "created_at": stamp,
+            "updated_at": stamp,
+            "version": 1,
+        })
+    return rows
+
+
+def create_schema(dsn: str):
+    with open(_SCHEMA_SQL) as f:
+        sql = f.read()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def seed_database(dsn: str, templates: int, months: int, start: dt_date, seed: int = 0) -> dict:
+    """
+    templates x months tables (one per template and month, a row per day),
+    plus one table per template holding every day of the period for wide
+    views, and the benchmark user. Previous benchmark data is replaced.
+    Returns {"month_tables": [(id, month), ...], "period_tables": [id, ...],
+    "start", "end"}.
+    """
+    # Imported late so the app reads BCRYPT_ROUNDS etc. from the caller's env.
+    from app.models.rows import refresh_month_totals
+    from app.services.password_service import hash_password
+
+    rng = random.Random(seed)
+    end = add_months(start, months) - timedelta(days=1)
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM table_month_totals WHERE template_id IN (
+                  SELECT id FROM table_templates WHERE name LIKE 'bench-%'
+                );
+                DELETE FROM table_rows WHERE table_id IN (
+                  SELECT t.id FROM tables t JOIN table_templates tt ON tt.id = t.template_id
+                  WHERE tt.name LIKE 'bench-%'
+                );
+                DELETE FROM tables WHERE template_id IN (
+                  SELECT id FROM table_templates WHERE name LIKE 'bench-%'
+                );
+                DELETE FROM table_templates WHERE name LIKE 'bench-%';
+                """
+            )
+            cur.execute(
+                """
+                INSERT INTO users (email, name, password_hash, is_admin)
+                VALUES (%s, 'Benchmark', %s, TRUE)
+                ON CONFLICT (email) DO UPDATE SET password_hash = EXCLUDED.password_hash, is_active = TRUE
+                RETURNING id;
+                """,
+                (BENCH_USER_EMAIL, hash_password(BENCH_USER_PASSWORD)),
+            )
+            user_id = cur.fetchone()[0]
+
+            month_tables, period_tables = [], []
+            for t in range(templates):
+                cur.execute(
+                    "INSERT INTO table_templates (name, description, schema_json) VALUES (%s, %s, %s) RETURNING id;",
+                    (f"bench-{t}", "benchmark template", Json(TEMPLATE_SCHEMA)),
+                )
+                template_id = cur.fetchone()[0]
+                for m in range(months):
+                    month = add_months(start, m)
+                    cur.execute(
+                        "INSERT INTO tables (template_id, name, period_start) VALUES (%s, %s, %s) RETURNING id;",
+                        (template_id, f"bench-{t} {month:%Y-%m}", month),
+                    )
+                    table_id = cur.fetchone()[0]
+                    month_tables.append((table_id, month))
+                    month_end = add_months(month, 1) - timedelta(days=1)
+                    _insert_days(cur, rng, table_id, month, month_end, user_id)
+                    refresh_month_totals(cur, table_id, month, month_end)
+                cur.execute(
+                    "INSERT INTO tables (template_id, name) VALUES (%s, %s) RETURNING id;",
+                    (template_id, f"bench-{t} all"),
+                )
+                table_id = cur.fetchone()[0]
+                period_tables.append(table_id)
+                _insert_days(cur, rng, table_id, start, end, user_id)
+                refresh_month_totals(cur, table_id, start, end)
+        conn.commit()
+    finally:
+        conn.close()
+    return {"month_tables": month_tables, "period_tables": period_tables, "start": start, "end": end}
+
+
+def find_seeded(dsn: str) -> dict | None:
+    """What seed_database created earlier, or None."""
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT t.id, t.period_start, min(r.row_date), max(r.row_date)
+                FROM tables t
+                JOIN table_templates tt ON tt.id = t.template_id
+                JOIN table_rows r ON r.table_id = t.id
+                WHERE tt.name LIKE 'bench-%'
+                GROUP BY t.id, t.period_start
+                ORDER BY t.id;
+                """
+            )
+            found = cur.fetchall()
+    finally:
+        conn.close()
+    period = [r for r in found if r[1] is None]
+    if not period:
+        return None
+    return {
+        "month_tables": [(r[0], r[1]) for r in found if r[1] is not None],
+        "period_tables": [r[0] for r in period],
+        "start": period[0][2],
+        "end": period[0][3],
+    }
+
+
+def _insert_days(cur, rng: random.Random, table_id: int, first: dt_date, last: dt_date, user_id: int):
+    values = []
+    day = first
+    while day <= last:
+        values.append((table_id, day, json.dumps(day_data(rng, day)), user_id))
+        day += timedelta(days=1)
+    execute_values(
+        cur,
+        "INSERT INTO table_rows (table_id, row_date, data, created_by) VALUES %s",
+        values,
+        template="(%s, %s, %s::jsonb, %s)",
+        page_size=1000,
+    )
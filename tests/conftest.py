@@ -0,0 +1,18 @@
+import os
+
+import psycopg2
+import pytest
+
+
+@pytest.fixture
+def db():
+    """A connection to DATABASE_URL, rolled back afterwards; skips without one."""
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        pytest.skip("DATABASE_URL is not set")
+    conn = psycopg2.connect(url)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+
+import asyncpg
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from app import db_async
+from app.db import TracingCursor, redact_plan
+
+
+@pytest.fixture
+def explain_all(monkeypatch):
+    monkeypatch.setattr("app.db.DB_SLOW_QUERY_MS", 0)
+    monkeypatch.setattr("app.db.DB_EXPLAIN_SAMPLE_RATE", 1)
+
+
+def test_redact_plan():
+    plan = redact_plan(
+        [
+            "Index Scan using table_rows_pkey on table_rows  (cost=0.29..8.31 rows=1 width=4)",
+            "  Index Cond: (table_id = 33)",
+            "  Filter: ((data ->> 'note'::text) = 'secret'::text)",
+        ]
+    )
+    assert "33" not in plan and "secret" not in plan
+    assert plan.splitlines()[1] == "  Index Cond: <redacted>"
+
+
+def test_failed_explain_keeps_the_transaction(db, explain_all, monkeypatch, caplog):
+    plain = psycopg2.extensions.cursor
+
+    class BrokenExplain(plain):
+        def execute(self, query, vars=None):
+            if query.startswith("EXPLAIN"):
+                query = "EXPLAIN SELECT no_such_column"
+            return super().execute(query, vars)
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], cursor_factory=TracingCursor)
+    try:
+        monkeypatch.setattr(psycopg2.extensions, "cursor", BrokenExplain)
+        with caplog.at_level(logging.WARNING, logger="app.db.slow"):
+            with conn.cursor() as cur:
+                cur.execute("SELECT %s::int", (1,))
+                cur.executemany("SELECT %s::int", [(1,), (2,)])
+                cur.execute("SELECT 2")
+                assert cur.fetchone() == (2,)
+        conn.commit()
+        messages = [r.getMessage() for r in caplog.records]
+        assert "EXPLAIN failed" in messages[0]
+        # executemany is logged without a plan.
+        assert "\n" not in messages[1]
+    finally:
+        conn.close()
+
+
+def test_failed_explain_keeps_the_transaction_async(db, explain_all):
+    async def run():
+        conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+        try:
+            async with conn.transaction():
+                # Runs as a simple query, but can't be prepared for EXPLAIN.
+                await db_async._traced(conn, "execute", "SELECT 1; SELECT 2", ())
+                return await db_async._traced(conn, "fetchval", "SELECT $1::int", (3,))
+        finally:
+            await conn.close()
+
+    assert asyncio.run(run()) == 3
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+from app.services.compute_engine import compute_running_fields
+from app.services.formulas import compile_formulas, template_formulas
+
+
+def _rows(datas, start=date(2030, 1, 1)):
+    return [
+        {"table_id": 1, "row_date": start.replace(day=i + 1), "data": data}
+        for i, data in enumerate(datas)
+    ]
+
+
+@pytest.mark.parametrize("source", ["уголь_т", "fact-day", "fact day", "k" * 80])
+def test_any_source_key(source):
+    formulas = template_formulas(
+        {
+            "columns": [
+                {"key": source},
+                {"key": "total", "formula": {"op": "running_sum", "of": source}},
+                {"key": "share", "formula": {"op": "ratio", "of": [source, "total"], "scale": 100}},
+            ]
+        }
+    )
+    rows = _rows([{source: "2"}, {}, {source: 3}, {source: "junk"}])
+    out = compute_running_fields(rows, date(2030, 1, 1), date(2030, 1, 4), formulas)
+    assert [r["data"]["total"] for r in out] == [2.0, 2.0, 5.0, 5.0]
+    assert [r["data"]["share"] for r in out] == [100.0, 0.0, 60.0, 0.0]
+    assert [r["row_date"] for r in out] == ["2030-01-01", "2030-01-02", "2030-01-03", "2030-01-04"]
+
+
+def test_typed_column_read_and_dropped():
+    formulas = template_formulas(
+        {"columns": [{"key": "sum", "formula": {"op": "running_sum", "of": "fact"}}]}
+    )
+    rows = _rows([{"fact": "junk"}, {"fact": 1}])
+    rows[0]["num_fact"] = 4.0
+    rows[1]["num_fact"] = 1.0
+    out = compute_running_fields(rows, date(2030, 1, 1), date(2030, 1, 2), formulas)
+    assert [r["data"]["sum"] for r in out] == [4.0, 5.0]
+    assert all("num_fact" not in r for r in out)
+
+
+def test_builtin_detection():
+    assert template_formulas({"columns": [{"key": "note"}]})["builtin"] is True
+    custom = template_formulas(
+        {"columns": [{"key": "sum", "formula": {"op": "running_sum", "of": "fact"}}]}
+    )
+    assert custom["builtin"] is False
+    assert custom["sources"] == ("fact",)
+
+
+@pytest.mark.parametrize(
+    "columns",
+    [
+        [{"key": "a", "formula": {"op": "median", "of": "b"}}],
+        [{"key": "a", "formula": {"op": "difference", "of": "b"}}],
+        [{"key": "a", "formula": {"op": "running_sum", "of": "b", "scale": 2}}],
+        [
+            {"key": "a", "formula": {"op": "running_sum", "of": "b"}},
+            {"key": "a", "formula": {"op": "running_sum", "of": "c"}},
+        ],
+        [
+            {"key": "a", "formula": {"op": "running_sum", "of": "b"}},
+            {"key": "b", "formula": {"op": "running_sum", "of": "a"}},
+        ],
+    ],
+)
+def test_invalid_formulas(columns):
+    with pytest.raises(ValueError):
+        compile_formulas(columns)
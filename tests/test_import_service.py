@@ -0,0 +1,101 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+from app.models.rows import copy_merge_rows
+from app.services import import_service
+from app.services.template_service import compile_template
+
+SCHEMA = {
+    "columns": [
+        {"key": "prod_fact_day_t", "title": "Fact", "editable": True},
+        {"key": "crew", "title": "Crew", "editable": True, "type": "number"},
+        {"key": "note", "title": "Note", "editable": True},
+        {"key": "code", "title": "Code", "editable": True},
+    ]
+}
+
+
+@pytest.fixture
+def imported(monkeypatch):
+    merged = []
+    compiled = compile_template({"id": 1, "schema_json": SCHEMA})
+    monkeypatch.setattr(import_service, "get_compiled_template_for_table", lambda table_id: compiled)
+    monkeypatch.setattr(
+        import_service,
+        "copy_merge_rows",
+        lambda table_id, rows, user_id: merged.extend(rows) or {"inserted": len(merged), "updated": 0},
+    )
+    monkeypatch.setattr(import_service, "invalidate_months", lambda table_id, months: 0)
+
+    def run(text):
+        summary = import_service.import_rows(1, io.BytesIO(text.encode()), "csv", 1)
+        return summary, merged
+
+    return run
+
+
+def test_numeric_cells_are_checked(imported):
+    summary, merged = imported(
+        "row_date;Fact;Crew;Note\n"
+        "2030-01-01;12,5;3;ok\n"
+        "2030-01-02;abc;3;ok\n"
+        "2030-01-03;1;x;\n"
+        "2030-01-04;;;free text\n"
+        "2030-01-05;1e400;2;\n"
+        "bad;1;1;\n"
+    )
+    assert [(line, day, data) for line, day, data in merged] == [
+        (2, date(2030, 1, 1), {"prod_fact_day_t": 12.5, "crew": 3, "note": "ok"}),
+        (5, date(2030, 1, 4), {"note": "free text"}),
+    ]
+    assert summary["lines"] == 6
+    assert summary["skipped"] == 4
+    assert summary["errors"] == [
+        {"line": 3, "error": "Not a number in Fact"},
+        {"line": 4, "error": "Not a number in Crew"},
+        {"line": 6, "error": "Not a number in Fact"},
+        {"line": 7, "error": "Invalid date, use YYYY-MM-DD or DD.MM.YYYY"},
+    ]
+
+
+def test_text_columns_keep_what_was_typed(imported):
+    _, merged = imported(
+        "row_date;Code;Note;Fact\n"
+        "2030-01-01; 007 ;1e5;007\n"
+        "2030-01-02;12,5;1_000;1e5\n"
+    )
+    assert [data for _, _, data in merged] == [
+        {"code": "007", "note": "1e5", "prod_fact_day_t": 7},
+        {"code": "12,5", "note": "1_000", "prod_fact_day_t": 100000.0},
+    ]
+
+
+def test_staging_table_leaves_real_tables_alone(db):
+    with db.cursor() as cur:
+        cur.execute(
+            "INSERT INTO table_templates (name, schema_json) VALUES ('import', %s) RETURNING id;",
+            (json.dumps(SCHEMA),),
+        )
+        template_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO tables (template_id, name) VALUES (%s, 'import') RETURNING id;", (template_id,))
+        table_id = cur.fetchone()[0]
+        cur.execute("CREATE TABLE import_rows (id integer);")
+    db.commit()
+    try:
+        result = copy_merge_rows(table_id, [(2, date(2030, 1, 1), {"prod_fact_day_t": 1})], None)
+        assert result == {"inserted": 1, "updated": 0}
+        with db.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.import_rows') IS NOT NULL;")
+            assert cur.fetchone()[0]
+    finally:
+        db.rollback()
+        with db.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS public.import_rows;")
+            cur.execute("DELETE FROM table_month_totals WHERE table_id = %s;", (table_id,))
+            cur.execute("DELETE FROM table_rows WHERE table_id = %s;", (table_id,))
+            cur.execute("DELETE FROM tables WHERE id = %s;", (table_id,))
+            cur.execute("DELETE FROM table_templates WHERE id = %s;", (template_id,))
+        db.commit()
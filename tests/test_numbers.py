@@ -0,0 +1,43 @@
+import json
+import math
+
+import pytest
+
+from app.models.rows import num_sql
+from app.models.typed_columns import XL_TO_FLOAT8_SQL
+from app.utils.numbers import to_number
+
+VALUES = [
+    None, True, False, 0, 12, -7.5, 1e300, [1], {"a": 1},
+    "", "abc", "1,5", " 12.5 ", "\t42\n", ".5", "-3.", "+7", "1E5",
+    "1e400", "-1e400", "1e-400", "1e99999", "1e-99999", "0e-99999",
+    "9" * 400, "0." + "0" * 400 + "1", "1.7976931348623157e308",
+]
+
+
+def _expected(value):
+    return float(value) if isinstance(value, bool) else to_number(value)
+
+
+def test_to_number_out_of_range():
+    assert to_number("1e400") == math.inf
+    assert to_number(-(10 ** 400)) == -math.inf
+    assert to_number("1e-400") == 0.0
+
+
+@pytest.mark.parametrize("function", [False, True])
+def test_sql_matches_to_number(db, function):
+    with db.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE num_values (data jsonb)")
+        for value in VALUES:
+            cur.execute("INSERT INTO num_values VALUES (%s)", (json.dumps({"k": value}),))
+        # Numbers past float range, which Python's json can't write.
+        cur.execute("""INSERT INTO num_values VALUES ('{"k": 1e400}'), ('{"k": -1e400}'), ('{"k": 1e-400}')""")
+        if function:
+            cur.execute(XL_TO_FLOAT8_SQL)
+            expr = "xl_to_float8(data -> 'k')"
+        else:
+            expr = num_sql("k")
+        cur.execute(f"SELECT data -> 'k', {expr} FROM num_values")
+        for value, parsed in cur.fetchall():
+            assert parsed == _expected(value), value
@@ -0,0 +1,79 @@
+"""
+ROW_TOTALS_MODE=sql (get_rows_with_running_totals) returns the same rows as
+the Python computation. Needs DATABASE_URL.
+"""
+import asyncio
+import json
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from app.db_async import close_async_pool
+from app.services.row_service import list_rows, list_rows_async
+from tests.test_compute_engine import _rows
+
+
+@pytest.fixture
+def table(db):
+    with db.cursor() as cur:
+        cur.execute(
+            "INSERT INTO table_templates (name, schema_json) VALUES ('parity', %s) RETURNING id;",
+            (json.dumps({"columns": [{"key": "prod_fact_day_t"}, {"key": "ovb_fact_day_m3"}]}),),
+        )
+        template_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO tables (template_id, name) VALUES (%s, 'parity') RETURNING id;", (template_id,))
+        table_id = cur.fetchone()[0]
+        for row in _rows(7, start=date(2030, 1, 1), days=150):
+            cur.execute(
+                "INSERT INTO table_rows (table_id, row_date, data) VALUES (%s, %s, %s);",
+                (table_id, row["row_date"], json.dumps(row["data"])),
+            )
+        # Numbers past float range, which Python's json can't write.
+        cur.execute(
+            """UPDATE table_rows SET data = data || '{"ovb_fact_day_m3": 1e400}'
+            WHERE table_id = %s AND row_date = '2030-02-10';""",
+            (table_id,),
+        )
+    db.commit()
+    try:
+        yield table_id
+    finally:
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM table_rows WHERE table_id = %s;", (table_id,))
+            cur.execute("DELETE FROM tables WHERE id = %s;", (table_id,))
+            cur.execute("DELETE FROM table_templates WHERE id = %s;", (template_id,))
+        db.commit()
+
+
+def _windows():
+    rng = random.Random(0)
+    windows = [("2030-01-01", "2030-01-31"), ("2030-02-15", "2030-02-15"), ("2030-01-20", "2030-05-31")]
+    for _ in range(20):
+        from_dt = date(2030, 1, 1) + timedelta(days=rng.randint(0, 140))
+        windows.append((from_dt.isoformat(), (from_dt + timedelta(days=rng.randint(0, 60))).isoformat()))
+    return windows
+
+
+def test_sql_matches_python(table):
+    for from_date, to_date in _windows():
+        python = list_rows(table, from_date, to_date, mode="python")
+        sql = list_rows(table, from_date, to_date, mode="sql")
+        assert json.dumps(sql, default=str) == json.dumps(python, default=str), (from_date, to_date)
+
+
+def test_sql_matches_python_async(table):
+    async def lists():
+        try:
+            return [
+                (
+                    await list_rows_async(table, from_date, to_date, mode="python"),
+                    await list_rows_async(table, from_date, to_date, mode="sql"),
+                )
+                for from_date, to_date in _windows()
+            ]
+        finally:
+            await close_async_pool()
+
+    for python, sql in asyncio.run(lists()):
+        assert json.dumps(sql, default=str) == json.dumps(python, default=str)
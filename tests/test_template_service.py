@@ -0,0 +1,31 @@
+import pytest
+
+from app.services.formulas import FormulaError
+from app.services.template_service import compile_template, template_formulas_of
+
+
+def test_invalid_formulas_only_fail_formula_users():
+    compiled = compile_template(
+        {
+            "id": 7,
+            "schema_json": {
+                "columns": [
+                    {"key": "fact", "editable": True, "type": "number"},
+                    {"key": "a", "formula": {"op": "running_sum", "of": "b"}},
+                    {"key": "b", "formula": {"op": "running_sum", "of": "a"}},
+                ]
+            },
+        }
+    )
+    # Saves and imports only need these.
+    assert "fact" in compiled["editable_keys"]
+    assert compiled["numeric_keys"] == {"fact"}
+    assert compiled["formulas"] is None
+    with pytest.raises(FormulaError, match="Template 7: Formula cycle"):
+        template_formulas_of(compiled)
+
+
+def test_valid_formulas():
+    compiled = compile_template({"id": 1, "schema_json": {"columns": []}})
+    assert compiled["formula_error"] is None
+    assert template_formulas_of(compiled)["builtin"] is True